@@ -0,0 +1,150 @@
+# Author: Shady Rashwan
+# Decode images in worker processes, handing the pixels back through shared memory
+
+import os
+import weakref
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+# Modes whose pixels survive a tobytes/frombytes round trip on their own;
+# anything else (palette images, mostly) is converted to RGB(A) first
+RAW_MODES = ('1', 'L', 'LA', 'RGB', 'RGBA', 'CMYK', 'I', 'F')
+
+# Rows copied into shared memory at a time, so a worker never holds a
+# second full-size copy of the pixels
+STRIP_ROWS = 64
+
+# What a worker sends back instead of the pixels: the name of the shared
+# memory block holding them, their mode and size, and the image's size as
+# stored in the file (before any downsampling)
+DecodedImage = namedtuple('DecodedImage', ['shm_name', 'mode', 'size', 'original_size'])
+
+_heif_registered = False
+
+def _raw_size(mode, size):
+    """Bytes of a RAW_MODES image's pixels as tobytes() packs them"""
+    width, height = size
+    if mode == '1':
+        return (width + 7) // 8 * height
+    return width * height * (4 if mode in ('I', 'F') else len(mode))
+
+def _write_rows(image, buffer):
+    """Pack image's pixels into buffer a strip of rows at a time"""
+    offset = 0
+    for top in range(0, image.height, STRIP_ROWS):
+        data = image.crop((0, top, image.width, min(image.height, top + STRIP_ROWS))).tobytes()
+        buffer[offset:offset + len(data)] = data
+        offset += len(data)
+
+def _decode(image_file, target=None, resample=None):
+    """Worker side: decode image_file (resampled to target if given) into a
+    new shared memory block and describe it"""
+    global _heif_registered
+    from PIL import Image
+    if image_file.lower().endswith('.heic') and not _heif_registered:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+        _heif_registered = True
+
+    with Image.open(image_file) as image:
+        original_size = image.size
+        if target:
+            # JPEGs can decode at a reduced scale for free; resample the rest of the way
+            image.draft(None, target)
+        image.load()
+        if image.mode not in RAW_MODES:
+            transparent = image.mode in ('PA', 'RGBa') or 'transparency' in image.info
+            image = image.convert('RGBA' if transparent else 'RGB')
+        if target and image.size != tuple(target):
+            image = image.resize(target, getattr(Image.Resampling, resample))
+
+        shm = shared_memory.SharedMemory(create=True, size=max(_raw_size(image.mode, image.size), 1))
+        try:
+            _write_rows(image, shm.buf)
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        shm.close()
+    return DecodedImage(shm.name, image.mode, image.size, original_size)
+
+def _attach(decoded, released):
+    """Parent side: a PIL image of a worker's pixels.
+
+    Pillow maps L, RGBA and CMYK pixels in place, without a copy; the block
+    then stays mapped as long as the image lives (until its page is written
+    and it is dropped), and is put on `released` to be closed after that.
+    Other modes are copied into Pillow's own layout and the block is closed
+    at once. Either way its name is removed now, so nothing is left behind
+    if this process dies.
+    """
+    from PIL import Image
+    shm = shared_memory.SharedMemory(name=decoded.shm_name)
+    shm.unlink()
+    try:
+        image = Image.frombuffer(decoded.mode, decoded.size, shm.buf, 'raw', decoded.mode, 0, 1)
+    except BaseException:
+        shm.close()
+        raise
+    if image.readonly:
+        # Runs while the image is being freed, before its pixels let go of the block
+        weakref.finalize(image, released.append, shm)
+    else:
+        shm.close()
+    return image
+
+class DecodePool:
+    """A process pool for the expensive decodes (HEIC above all).
+
+    Decoding runs in `workers` processes, so it isn't serialised by the GIL,
+    and each worker writes the decoded (and, if asked, resampled) pixels
+    into a shared memory block. Only the block's name crosses the process
+    boundary, and the caller's image is mapped onto the block where Pillow
+    allows it (see _attach), instead of a pickle being built, piped and
+    unpickled for every image.
+
+    decode() blocks until its image is done, so call it from the prefetch
+    threads: with at least as many prefetch threads as workers, every
+    worker stays busy.
+    """
+    def __init__(self, workers=None):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import resource_tracker
+        # Start the tracker here so the workers share it: blocks they create
+        # and this process unlinks are then never reported as leaked
+        resource_tracker.ensure_running()
+        self.workers = workers or os.cpu_count() or 1
+        # Workers are started from the prefetch threads, and forking a process
+        # that has other threads running can deadlock the child
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context(method))
+        self._released = []  # Blocks whose images are gone, closed by _free
+
+    def decode(self, image_file, target=None, resample=None):
+        """Decode image_file in a worker; returns (PIL image, original size)"""
+        self._free()
+        decoded = self._executor.submit(_decode, image_file, target, resample).result()
+        return _attach(decoded, self._released), decoded.original_size
+
+    def _free(self):
+        """Close the blocks of the mapped images freed so far"""
+        while self._released:
+            shm = self._released.pop()
+            try:
+                shm.close()
+            except BufferError:
+                # Its image is still being torn down on another thread; close it next time
+                self._released.append(shm)
+                return
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+        self._free()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,122 @@
+# Author: Shady Rashwan
+# Find exact and near-duplicate images in a folder before it is converted
+
+import time
+from collections import defaultdict, namedtuple
+import image_cache
+import image_probe
+
+# A difference hash compares neighbouring pixels of a DHASH_SIZE + 1 by
+# DHASH_SIZE greyscale thumbnail, giving DHASH_SIZE ** 2 bits
+DHASH_SIZE = 8
+DHASH_BITS = DHASH_SIZE * DHASH_SIZE
+
+# Differing dHash bits still taken as the same picture (--skip-near-duplicates)
+DEFAULT_NEAR_DISTANCE = 4
+
+# Threads hashing files; hashlib and Pillow's decoders release the GIL
+HASH_WORKERS = 4
+
+# What find_duplicates found: exact copies and near-duplicates, each mapped
+# to the earlier file (in page order) they repeat, and the seconds hashing took
+Duplicates = namedtuple('Duplicates', ['exact', 'near', 'seconds'])
+
+def content_hash(entry):
+    """SHA-256 of an ImageEntry's file, or None if it can't be read"""
+    try:
+        return image_cache.file_hash(entry.path)
+    except OSError:
+        return None
+
+def dhash(entry):
+    """Difference hash of an ImageEntry's first frame, upright: one bit per
+    pair of neighbouring thumbnail pixels, set where brightness rises left
+    to right. JPEGs decode at 1/8 scale for it. None for files that can't
+    be read and for multi-frame files, which are never taken as
+    near-duplicates."""
+    from PIL import Image
+    try:
+        info = image_probe.probe_image(entry.path, entry.size, entry.mtime, count_frames=True)
+        if info.frames > 1:
+            return None
+        with Image.open(entry.path) as image:
+            image.draft('L', (DHASH_SIZE * 4, DHASH_SIZE * 4))
+            thumbnail = image.convert('L').resize((DHASH_SIZE * 4, DHASH_SIZE * 4), Image.Resampling.BOX)
+    except Exception:
+        return None
+    turn = image_probe.ORIENTATION_TURNS.get(info.orientation)
+    if turn:
+        thumbnail = thumbnail.transpose(getattr(Image.Transpose, turn))
+    pixels = thumbnail.resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.BOX).tobytes()
+    bits = 0
+    for row in range(DHASH_SIZE):
+        for col in range(DHASH_SIZE):
+            left = row * (DHASH_SIZE + 1) + col
+            bits = bits << 1 | (pixels[left + 1] > pixels[left])
+    return bits
+
+def _bands(bits, count):
+    """Split a dHash into `count` bands of bits, tagged with their position.
+    Two hashes within count - 1 bits of each other agree on at least one
+    band, so only hashes sharing a band need comparing."""
+    width = -(-DHASH_BITS // count)
+    mask = (1 << width) - 1
+    return [(band, bits >> (band * width) & mask) for band in range(count)]
+
+def find_near(hashes, distance):
+    """{path: earlier path} for every hash within `distance` bits of an
+    earlier one kept; hashes is a list of (path, dHash) in page order"""
+    near = {}
+    seen = defaultdict(list)  # band -> [(path, dHash)] of the pages kept
+    for path, bits in hashes:
+        bands = _bands(bits, distance + 1)
+        match = next((other for band in bands for other, other_bits in seen[band]
+                      if (bits ^ other_bits).bit_count() <= distance), None)
+        if match is not None:
+            near[path] = match
+            continue
+        for band in bands:
+            seen[band].append((path, bits))
+    return near
+
+def find_duplicates(entries, exact=True, near_distance=None, workers=HASH_WORKERS):
+    """Look for repeated images among a folder's ImageEntry list, in page order.
+
+    With exact=True, files with the same content (same size, then same
+    SHA-256) map to the first of them; only files whose size is shared are
+    read, so a folder without copies costs no I/O. With a near_distance,
+    the other single-frame images are also compared by dHash, and one
+    within that many bits of an earlier image maps to it, and so do the
+    exact copies of such an image. The first file of each group is never in
+    either dict.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    start = time.perf_counter()
+    found = {}
+    near = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if exact:
+            by_size = defaultdict(list)
+            for entry in entries:
+                by_size[entry.size].append(entry)
+            candidates = [entry for group in by_size.values() if len(group) > 1 for entry in group]
+            hashes = dict(zip((entry.path for entry in candidates), executor.map(content_hash, candidates)))
+            first = {}
+            for entry in entries:
+                digest = hashes.get(entry.path)
+                if digest is not None:
+                    original = first.setdefault((entry.size, digest), entry.path)
+                    if original != entry.path:
+                        found[entry.path] = original
+
+        if near_distance is not None:
+            kept = [entry for entry in entries if entry.path not in found]
+            hashes = [(entry.path, bits) for entry, bits in zip(kept, executor.map(dhash, kept))
+                      if bits is not None]
+            near = find_near(hashes, near_distance)
+            # Copies of a skipped image are skipped with it, not shared with a page that isn't there
+            for path, original in list(found.items()):
+                if original in near:
+                    near[path] = near[original]
+                    del found[path]
+    return Duplicates(found, near, time.perf_counter() - start)
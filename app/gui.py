@@ -2,10 +2,13 @@
 # Streamlit GUI for Images to PDF Converter
 
 import os
+import time
 import streamlit as st
 import tempfile
-from PIL import Image
 import shi as shi  # Import the main module
+import image_count
+import jobs
+import thumbnails
 
 def set_page_config():
     """Configure the Streamlit page settings with Tailwind-inspired dark mode styling"""
@@ -121,166 +124,184 @@ def set_page_config():
     </style>
     """, unsafe_allow_html=True)
 
-class OutputCapture:
-    """Class to capture print outputs from the medical module"""
-    def __init__(self):
-        self.outputs = []
-    
-    def write(self, text):
-        self.outputs.append(str(text))
-    
-    def flush(self):
-        pass
-    
-    def get_output(self):
-        return "\n".join(self.outputs)
+# Choices for the resolution selector: label -> target DPI (None = keep original)
+DPI_OPTIONS = {
+    "Original resolution": None,
+    "High (300 DPI)": 300,
+    "Medium (200 DPI)": 200,
+    "Small (150 DPI)": 150,
+}
+
+# Choices for the page order selector: label -> shi sort order
+SORT_OPTIONS = {
+    "File name": "name",
+    "File name, numbers by value": "natural",
+    "Date taken": "captured",
+}
+
+# Thumbnails on one page of the preview grid, and the grid's columns
+PREVIEW_PAGE_SIZE = 12
+PREVIEW_COLUMNS = 4
+
+@st.cache_resource
+def get_image_counter():
+    """One ImageCounter per server process, so every session shares its directory cache"""
+    return image_count.ImageCounter()
+
+@st.cache_resource
+def get_thumbnailer():
+    """One Thumbnailer per server process, so every session shares its threads and disk cache"""
+    return thumbnails.Thumbnailer()
+
+@st.cache_resource
+def get_job_runner():
+    """One JobRunner per server process, shared by every session and rerun"""
+    return jobs.JobRunner()
 
-def process_folder(folder_path, preserve_originals):
-    """Process the folder with minimal display"""
+def process_folder(folder_path, preserve_originals, dpi=None, sort="name"):
+    """Start converting the folder as a background job (see show_job)"""
     folder_path = normalize_path(folder_path)
     
     if not os.path.exists(folder_path) or not os.path.isdir(folder_path):
         st.error(f"Invalid path: '{folder_path}'")
         return
     
+    job = get_job_runner().submit(folder_path, preserve_originals=preserve_originals, dpi=dpi, sort=sort)
+    st.session_state.job_id = job.id
+
+def show_job(job):
+    """Show a conversion job's progress, or its outcome once it is over.
+
+    Returns True while the job is still going, so the caller can rerun the
+    script to poll it.
+    """
+    snapshot = job.snapshot()
+    folder_path = snapshot['folder']
+    
     # Simple status and progress display
     status = st.empty()
-    progress = st.progress(0)
-    
-    # Set up output capture
-    import sys
-    original_stdout = sys.stdout
-    capture = OutputCapture()
-    sys.stdout = capture
-    
-    try:
-        # Initial status
-        status.info("Processing images...")
-        
-        # Simple progress tracking
-        def check_progress():
-            output = capture.get_output()
-            if "Processing images" in output:
-                progress.progress(0.2)
-                status.info("Reading image files...")
-            elif "Converting .heic" in output:
-                progress.progress(0.4)
-                status.info("Converting image formats...")
-            elif "Creating PDF" in output:
-                progress.progress(0.7)
-                status.info("Creating PDF file...")
-            elif "Finished creating:" in output:
-                progress.progress(1.0)
-                status.success("Conversion complete!")
-        
-        # Initial check
-        check_progress()
-        
-        # Run the main function
-        shi.create_pdf_from_images(folder_path, preserve_originals=preserve_originals)
-        
-        # Final progress update
+    progress = st.progress(snapshot['fraction'])
+    
+    if snapshot['state'] == jobs.QUEUED:
+        status.info("Waiting for the previous conversion to finish...")
+    elif snapshot['state'] in (jobs.RUNNING, jobs.CANCELLING):
+        if snapshot['images_total']:
+            status.info(f"Creating PDFs: {snapshot['images_done']} of {snapshot['images_total']} images "
+                        f"({snapshot['images_per_second']:.1f} images/s)")
+        else:
+            status.info("Reading image files...")
+        show_folder_progress(snapshot)
+    
+    if snapshot['state'] not in jobs.FINISHED_STATES:
+        if snapshot['state'] == jobs.CANCELLING:
+            st.caption("Stopping after the current page...")
+        elif st.button("Cancel", key=f"cancel_job_{job.id}"):
+            job.cancel()
+        return True
+    
+    results = snapshot['results']
+    if snapshot['state'] == jobs.CANCELLED:
+        kept = sum(len(r['pdf_files']) for r in results if not r['skipped'])
+        status.warning(f"Conversion cancelled. {kept} finished PDF{'s were' if kept != 1 else ' was'} kept; "
+                       f"no partial PDFs were written.")
+    elif snapshot['state'] == jobs.FAILED:
         progress.progress(1.0)
+        status.error("Conversion failed")
+        st.error(snapshot['error'])
+    else:
+        show_results(status, results, folder_path, job.preserve_originals, snapshot['elapsed'])
+    return False
+
+def show_folder_progress(snapshot, limit=8):
+    """List the most recent folders of a running job with their image counts"""
+    folders = list(snapshot['folders'].items())[-limit:]
+    lines = []
+    for folder, info in folders:
+        name = os.path.relpath(folder, snapshot['folder'])
+        if name == '.':
+            name = os.path.basename(folder)
+        marker = {"done": "✅", "skipped": "⏭️", "error": "❌"}.get(info['state'], "⏳")
+        lines.append(f"- {marker} `{name}`: {info['done']} of {info['images']} images")
+    if lines:
+        st.markdown("\n".join(lines))
+
+def show_results(status, results, folder_path, preserve_originals, elapsed):
+    """Show the outcome of a finished conversion"""
+    # Count the PDFs written (a folder split into volumes has several)
+    pdf_count = sum(len(r['pdf_files']) for r in results)
+    
+
+    # Display celebratory results with Tailwind-style components
+    if pdf_count:
+        # Update the status message to lime green
+        deletion_text = " (original images deleted)" if not preserve_originals else ""
+        status.success(f"Created {pdf_count} PDF file{'s' if pdf_count > 1 else ''} in {folder_path}{deletion_text}")
         
-        # Get output text to scan for results
-        output = capture.get_output()
-        
-        # Extract basic results information
-        pdf_count = 0
-        pdf_files = []
-        
-        # Find main PDF file
-        folder_name = os.path.basename(folder_path)
-        expected_pdf = f"{folder_name}.pdf"
-        pdf_path = os.path.join(folder_path, expected_pdf)
-        
-        if os.path.exists(pdf_path):
-            pdf_count += 1
-            pdf_files.append(pdf_path)
-        
-        # Find PDFs in subfolders (minimal check)
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                if file.lower().endswith('.pdf') and os.path.join(root, file) not in pdf_files:
-                    pdf_count += 1
-        
-        # Display celebratory results with Tailwind-style components
-        if "Finished creating:" in output:
-            # Update the status message to lime green
-            deletion_text = " (original images deleted)" if not preserve_originals else ""
-            status.success(f"Created {pdf_count} PDF file{'s' if pdf_count > 1 else ''} in {folder_path}{deletion_text}")
-            
-            # Create different HTML based on whether images were preserved or deleted
-            if preserve_originals:
-                success_html = f"""
-                <div class="success-box" style="background-color: #1e1e1e !important; color: #84cc16 !important;">
-                    <div style="display:flex; align-items:center; margin-bottom:1rem; gap:0.75rem;">
-                        <div style="background-color:rgba(132, 204, 22, 0.2); height:2.5rem; width:2.5rem; border-radius:0.5rem; display:flex; align-items:center; justify-content:center;">
-                            <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#84cc16" width="24" height="24">
-                                <path stroke-linecap="round" stroke-linejoin="round" d="M9 12.75L11.25 15 15 9.75M21 12a9 9 0 11-18 0 9 9 0 0118 0z" />
-                            </svg>
-                        </div>
-                        <h3 style="margin:0; font-weight:600; color:#84cc16; font-size:1.125rem;">Success!</h3>
+        # Create different HTML based on whether images were preserved or deleted
+        if preserve_originals:
+            success_html = f"""
+            <div class="success-box" style="background-color: #1e1e1e !important; color: #84cc16 !important;">
+                <div style="display:flex; align-items:center; margin-bottom:1rem; gap:0.75rem;">
+                    <div style="background-color:rgba(132, 204, 22, 0.2); height:2.5rem; width:2.5rem; border-radius:0.5rem; display:flex; align-items:center; justify-content:center;">
+                        <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#84cc16" width="24" height="24">
+                            <path stroke-linecap="round" stroke-linejoin="round" d="M9 12.75L11.25 15 15 9.75M21 12a9 9 0 11-18 0 9 9 0 0118 0z" />
+                        </svg>
                     </div>
-                    <div style="margin-left:0.5rem; display:flex; flex-direction:column; gap:0.75rem;">
-                        <div style="display:flex; gap:0.75rem; align-items:center;">
-                            <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#0078D7" width="20" height="20">
-                                <path stroke-linecap="round" stroke-linejoin="round" d="M19.5 14.25v-2.625a3.375 3.375 0 00-3.375-3.375h-1.5A1.125 1.125 0 0113.5 7.125v-1.5a3.375 3.375 0 00-3.375-3.375H8.25m2.25 0H5.625c-.621 0-1.125.504-1.125 1.125v17.25c0 .621.504 1.125 1.125 1.125h12.75c.621 0 1.125-.504 1.125-1.125V11.25a9 9 0 00-9-9z" />
-                            </svg>
-                            <span style="color: #84cc16; font-weight: bold;">
-                                {pdf_count} PDF{'s' if pdf_count > 1 else ''} saved in: 
-                                <code style="background:#374151; padding:0.125rem 0.25rem; border-radius:0.25rem; font-size:0.875rem;">{folder_path}</code>
-                            </span>
-                        </div>
+                    <h3 style="margin:0; font-weight:600; color:#84cc16; font-size:1.125rem;">Success!</h3>
+                </div>
+                <div style="margin-left:0.5rem; display:flex; flex-direction:column; gap:0.75rem;">
+                    <div style="display:flex; gap:0.75rem; align-items:center;">
+                        <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#0078D7" width="20" height="20">
+                            <path stroke-linecap="round" stroke-linejoin="round" d="M19.5 14.25v-2.625a3.375 3.375 0 00-3.375-3.375h-1.5A1.125 1.125 0 0113.5 7.125v-1.5a3.375 3.375 0 00-3.375-3.375H8.25m2.25 0H5.625c-.621 0-1.125.504-1.125 1.125v17.25c0 .621.504 1.125 1.125 1.125h12.75c.621 0 1.125-.504 1.125-1.125V11.25a9 9 0 00-9-9z" />
+                        </svg>
+                        <span style="color: #84cc16; font-weight: bold;">
+                            {pdf_count} PDF{'s' if pdf_count > 1 else ''} saved in: 
+                            <code style="background:#374151; padding:0.125rem 0.25rem; border-radius:0.25rem; font-size:0.875rem;">{folder_path}</code>
+                        </span>
                     </div>
                 </div>
-                """
-            else:
-                success_html = f"""
-                <div class="success-box" style="background-color: #1e1e1e !important; color: #84cc16 !important;">
-                    <div style="display:flex; align-items:center; margin-bottom:1rem; gap:0.75rem;">
-                        <div style="background-color:rgba(132, 204, 22, 0.2); height:2.5rem; width:2.5rem; border-radius:0.5rem; display:flex; align-items:center; justify-content:center;">
-                            <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#84cc16" width="24" height="24">
-                                <path stroke-linecap="round" stroke-linejoin="round" d="M9 12.75L11.25 15 15 9.75M21 12a9 9 0 11-18 0 9 9 0 0118 0z" />
-                            </svg>
-                        </div>
-                        <h3 style="margin:0; font-weight:600; color:#84cc16; font-size:1.125rem;">Success!</h3>
+            </div>
+            """
+        else:
+            success_html = f"""
+            <div class="success-box" style="background-color: #1e1e1e !important; color: #84cc16 !important;">
+                <div style="display:flex; align-items:center; margin-bottom:1rem; gap:0.75rem;">
+                    <div style="background-color:rgba(132, 204, 22, 0.2); height:2.5rem; width:2.5rem; border-radius:0.5rem; display:flex; align-items:center; justify-content:center;">
+                        <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#84cc16" width="24" height="24">
+                            <path stroke-linecap="round" stroke-linejoin="round" d="M9 12.75L11.25 15 15 9.75M21 12a9 9 0 11-18 0 9 9 0 0118 0z" />
+                        </svg>
+                    </div>
+                    <h3 style="margin:0; font-weight:600; color:#84cc16; font-size:1.125rem;">Success!</h3>
+                </div>
+                <div style="margin-left:0.5rem; display:flex; flex-direction:column; gap:0.75rem;">
+                    <div style="display:flex; gap:0.75rem; align-items:center;">
+                        <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#0078D7" width="20" height="20">
+                            <path stroke-linecap="round" stroke-linejoin="round" d="M19.5 14.25v-2.625a3.375 3.375 0 00-3.375-3.375h-1.5A1.125 1.125 0 0113.5 7.125v-1.5a3.375 3.375 0 00-3.375-3.375H8.25m2.25 0H5.625c-.621 0-1.125.504-1.125 1.125v17.25c0 .621.504 1.125 1.125 1.125h12.75c.621 0 1.125-.504 1.125-1.125V11.25a9 9 0 00-9-9z" />
+                        </svg>
+                        <span style="color: #84cc16; font-weight: bold;">
+                            {pdf_count} PDF{'s' if pdf_count > 1 else ''} saved in: 
+                            <code style="background:#374151; padding:0.125rem 0.25rem; border-radius:0.25rem; font-size:0.875rem;">{folder_path}</code>
+                        </span>
                     </div>
-                    <div style="margin-left:0.5rem; display:flex; flex-direction:column; gap:0.75rem;">
-                        <div style="display:flex; gap:0.75rem; align-items:center;">
-                            <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#0078D7" width="20" height="20">
-                                <path stroke-linecap="round" stroke-linejoin="round" d="M19.5 14.25v-2.625a3.375 3.375 0 00-3.375-3.375h-1.5A1.125 1.125 0 0113.5 7.125v-1.5a3.375 3.375 0 00-3.375-3.375H8.25m2.25 0H5.625c-.621 0-1.125.504-1.125 1.125v17.25c0 .621.504 1.125 1.125 1.125h12.75c.621 0 1.125-.504 1.125-1.125V11.25a9 9 0 00-9-9z" />
-                            </svg>
-                            <span style="color: #84cc16; font-weight: bold;">
-                                {pdf_count} PDF{'s' if pdf_count > 1 else ''} saved in: 
-                                <code style="background:#374151; padding:0.125rem 0.25rem; border-radius:0.25rem; font-size:0.875rem;">{folder_path}</code>
-                            </span>
-                        </div>
-                        <div style="display:flex; gap:0.75rem; align-items:center; margin-top:0.5rem;">
-                            <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#f97316" width="20" height="20">
-                                <path stroke-linecap="round" stroke-linejoin="round" d="M14.74 9l-.346 9m-4.788 0L9.26 9m9.968-3.21c.342.052.682.107 1.022.166m-1.022-.165L18.16 19.673a2.25 2.25 0 01-2.244 2.077H8.084a2.25 2.25 0 01-2.244-2.077L4.772 5.79m14.456 0a48.108 48.108 0 00-3.478-.397m-12 .562c.34-.059.68-.114 1.022-.165m0 0a48.11 48.11 0 013.478-.397m7.5 0v-.916c0-1.18-.91-2.164-2.09-2.201a51.964 51.964 0 00-3.32 0c-1.18.037-2.09 1.022-2.09 2.201v.916m7.5 0a48.667 48.667 0 00-7.5 0" />
-                            </svg>
-                            <span style="color: #f97316;">
-                                Original images were deleted
-                            </span>
-                        </div>
+                    <div style="display:flex; gap:0.75rem; align-items:center; margin-top:0.5rem;">
+                        <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="#f97316" width="20" height="20">
+                            <path stroke-linecap="round" stroke-linejoin="round" d="M14.74 9l-.346 9m-4.788 0L9.26 9m9.968-3.21c.342.052.682.107 1.022.166m-1.022-.165L18.16 19.673a2.25 2.25 0 01-2.244 2.077H8.084a2.25 2.25 0 01-2.244-2.077L4.772 5.79m14.456 0a48.108 48.108 0 00-3.478-.397m-12 .562c.34-.059.68-.114 1.022-.165m0 0a48.11 48.11 0 013.478-.397m7.5 0v-.916c0-1.18-.91-2.164-2.09-2.201a51.964 51.964 0 00-3.32 0c-1.18.037-2.09 1.022-2.09 2.201v.916m7.5 0a48.667 48.667 0 00-7.5 0" />
+                        </svg>
+                        <span style="color: #f97316;">
+                            Original images were deleted
+                        </span>
                     </div>
                 </div>
-                """
-            
-            # Render the appropriate HTML
-            st.markdown(success_html, unsafe_allow_html=True)
-        else:
-            status.warning("Process completed but no PDFs were created")
-    
-    except Exception as e:
-        progress.progress(1.0)
-        status.error("Conversion failed")
-        st.error(str(e))
-    
-    finally:
-        # Restore stdout
-        sys.stdout = original_stdout
+            </div>
+            """
+        
+        # Render the appropriate HTML
+        st.markdown(success_html, unsafe_allow_html=True)
+
+        # Size and time summary (shows the savings when downsampling)
+        st.caption(shi.summarize_results(results, elapsed))
+    else:
+        status.warning("Process completed but no PDFs were created")
 
 def display_welcome():
     """Display a decorated welcome header with separate feature cards"""
@@ -420,7 +441,13 @@ def on_path_change():
     # Mark that we need to force rerun of the app which helps with instant validation after paste
     st.session_state.need_rerun = True
     
-    # Reset validation state
+    # Reset validation state, stopping any count still running for the old path
+    if st.session_state.get("count_job") is not None:
+        st.session_state.count_job.cancel()
+        st.session_state.count_job = None
+    if st.session_state.get("preview_job") is not None:
+        st.session_state.preview_job.cancel()
+        st.session_state.preview_job = None
     st.session_state.valid_path = False
     st.session_state.path_info = ""
     st.session_state.current_valid_path = None
@@ -438,34 +465,105 @@ def on_path_change():
         st.session_state.path_info = "❌ Invalid folder path"
         return
     
-    # If we get here, path exists, now count images
-    try:
-        # Start a count
-        image_count = 0
+    # Path exists; count its images in the background (see refresh_image_count)
+    st.session_state.count_job = get_image_counter().count(normalized_path)
+    st.session_state.path_info = "🔎 Looking for images..."
+
+def refresh_image_count():
+    """Update the path status from the background image count.
+
+    Returns True while the count is still running, so the caller can rerun
+    the script to show it growing.
+    """
+    job = st.session_state.get("count_job")
+    if job is None:
+        return False
+    
+    # Read done first: once it is set the count is final
+    done = job.done
+    found = job.count
+    if not done:
+        st.session_state.path_info = f"🔎 Found {found} image{'s' if found != 1 else ''} so far..."
+        return True
+    
+    st.session_state.count_job = None
+    if job.error:
+        # Handle any unexpected errors during validation
+        st.session_state.path_info = f"❌ Error validating path: {job.error}"
+    elif found > 0:
+        # Valid path with images: store valid path information
+        st.session_state.valid_path = True
+        st.session_state.current_valid_path = job.path
+        st.session_state.current_image_count = found
+        st.session_state.path_info = f"✅ Found {found} image{'s' if found > 1 else ''}"
+    else:
+        # Valid path but no images
+        st.session_state.path_info = "⚠️ No images found in this folder"
+    return False
+
+def show_preview(folder_path, sort):
+    """Show the first pages of each PDF the folder will produce as thumbnails.
+
+    The folder is listed and the thumbnails are made in the background (see
+    thumbnails.Thumbnailer); only the grid page on screen and the one after
+    it are asked for, so large folders open at once. Returns True while
+    anything shown is still loading, so the caller can rerun the script to
+    fill it in.
+    """
+    thumbnailer = get_thumbnailer()
+    job = st.session_state.get("preview_job")
+    if job is None or (job.path, job.sort) != (folder_path, sort):
+        if job is not None:
+            job.cancel()
+        job = st.session_state.preview_job = thumbnailer.list_folders(folder_path, sort)
+    
+    with st.expander("Preview pages", expanded=True):
+        if not job.done:
+            st.caption("Listing pages...")
+            return True
+        if job.error:
+            st.caption(f"Can't show a preview: {job.error}")
+            return False
+        if not job.folders:
+            return False
         
-        # Count images in folder (use a generator to be more efficient)
-        for root, _, files in os.walk(normalized_path):
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in shi.IMAGE_EXTENSIONS):
-                    image_count += 1
-                    # For efficiency, if we found some images we could stop counting
-                    # after a reasonable number, but we'll count all for accuracy
+        folders = dict(job.folders)
+        folder = next(iter(folders))
+        if len(folders) > 1:
+            folder = st.selectbox(
+                "PDF",
+                list(folders),
+                key="preview_folder",
+                format_func=lambda f: os.path.basename(f) + ".pdf",
+                help="Each folder with images becomes a PDF of its own."
+            )
+        entries = folders[folder]
         
-        # Valid path with images
-        if image_count > 0:
-            path_info = f"✅ Found {image_count} image{'s' if image_count > 1 else ''}"
-            
-            # Store valid path information
-            st.session_state.valid_path = True
-            st.session_state.current_valid_path = normalized_path
-            st.session_state.current_image_count = image_count
-            st.session_state.path_info = path_info
-        else:
-            # Valid path but no images
-            st.session_state.path_info = "⚠️ No images found in this folder"
-    except Exception as e:
-        # Handle any unexpected errors during validation
-        st.session_state.path_info = f"❌ Error validating path: {str(e)}"
+        grid_pages = -(-len(entries) // PREVIEW_PAGE_SIZE)
+        grid_page = 1
+        if grid_pages > 1:
+            # One widget per folder, so switching folders starts at its first page
+            grid_page = st.number_input("Preview page", min_value=1, max_value=grid_pages, value=1,
+                                        key=f"preview_page_{folder}")
+        start = (grid_page - 1) * PREVIEW_PAGE_SIZE
+        shown = entries[start:start + PREVIEW_PAGE_SIZE]
+        st.caption(f"Images {start + 1}-{start + len(shown)} of {len(entries)}, in page order")
+        
+        loading = False
+        columns = st.columns(PREVIEW_COLUMNS)
+        for number, entry in enumerate(shown, start + 1):
+            done, data = thumbnailer.get(entry)
+            with columns[(number - 1) % PREVIEW_COLUMNS]:
+                if data:
+                    st.image(data, caption=f"{number}. {entry.name}", use_container_width=True)
+                elif done:
+                    st.caption(f"{number}. {entry.name} (no preview)")
+                else:
+                    st.caption(f"{number}. {entry.name} (loading...)")
+                    loading = True
+        # Have the next grid page ready by the time it is asked for
+        thumbnailer.prefetch(entries[start + PREVIEW_PAGE_SIZE:start + 2 * PREVIEW_PAGE_SIZE])
+        return loading
 
 class PathWatcher:
     """Class to watch path input and trigger validation without Enter key."""
@@ -519,6 +617,9 @@ class PathWatcher:
                 # Set flag to force rerun (this is critical for validation to show immediately)
                 st.session_state.need_rerun = True
         
+        # Pick up the result (or progress) of the background image count
+        st.session_state.counting_images = refresh_image_count()
+        
         # Check if we have a valid path in session state
         valid_path = st.session_state.get("valid_path", False)
         normalized_path = st.session_state.get("current_valid_path", None) if valid_path else None
@@ -685,7 +786,25 @@ def main():
         st.markdown(f"<div class='path-info'>{st.session_state.path_info}</div>", unsafe_allow_html=True)
     
     # Delete checkbox and Convert button (only if path is valid)
+    loading_preview = False
     if "valid_path" in st.session_state and st.session_state.valid_path:
+        # Output resolution: lower DPI means smaller, faster PDFs
+        dpi_label = st.selectbox(
+            "Image resolution",
+            list(DPI_OPTIONS),
+            key="dpi_select",
+            help="Downsample images to the size they are shown on the page. Lower values give smaller PDFs."
+        )
+        sort_label = st.selectbox(
+            "Page order",
+            list(SORT_OPTIONS),
+            key="sort_select",
+            help="Order pages by file name, by file name with img2 before img10, or by the date the photo was taken."
+        )
+        
+        # Thumbnails of the pages in the chosen order, to catch ordering or rotation problems before converting
+        loading_preview = show_preview(folder_path, SORT_OPTIONS[sort_label])
+        
         # Create columns for checkbox and button
         col1, col2, col3 = st.columns([3, 1, 2])
         
@@ -779,9 +898,16 @@ def main():
             # Clear the last input value to reset state
             st.session_state.last_input_value = ""
             
-            st.write("---")
             # Process the folder (preserve_originals is the opposite of delete_originals)
-            process_folder(folder_path, preserve_originals=not delete_originals)
+            process_folder(folder_path, preserve_originals=not delete_originals, dpi=DPI_OPTIONS[dpi_label],
+                           sort=SORT_OPTIONS[sort_label])
+    
+    # Progress or outcome of this session's latest conversion
+    job = get_job_runner().get(st.session_state.get("job_id"))
+    job_running = False
+    if job is not None:
+        st.write("---")
+        job_running = show_job(job)
     
     # Footer with "Made with love" text in Tailwind style
     st.write("")
@@ -796,6 +922,11 @@ def main():
         </div>
     </div>
     """, unsafe_allow_html=True)
+    
+    # Poll the running job, image count or preview: rerun the script to redraw its progress
+    if job_running or loading_preview or st.session_state.get("counting_images", False):
+        time.sleep(0.5)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
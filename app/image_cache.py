@@ -0,0 +1,134 @@
+# Author: Shady Rashwan
+# On-disk cache of prepared (decoded and resampled) images for shi
+
+import os
+import json
+import hashlib
+import threading
+
+# Bump when the layout of cached entries or the way they are produced changes
+CACHE_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'shi')
+DEFAULT_MAX_MB = 1024
+
+def file_hash(file_path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ConversionCache:
+    """Content-addressed store of ready-to-embed image data.
+
+    Entries are keyed by the hash of the source file plus the conversion
+    settings, so a renamed or copied photo still hits and a changed DPI or
+    quality misses. Each entry is one file holding a JSON header line (pixel
+    sizes, frame count) followed by the encoded image. When the directory
+    grows past max_mb the least recently used entries are evicted; a hit
+    bumps the entry's mtime. Safe to share between threads, and between
+    processes pointing at the same directory.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_mb=DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def __reduce__(self):
+        # Worker processes get a fresh instance on the same directory
+        return (ConversionCache, (self.cache_dir, self.max_bytes / (1024 * 1024)))
+
+    def key(self, content_hash, settings, frame=0):
+        """Cache key for one frame of a source file under the given settings"""
+        params = json.dumps({'settings': settings, 'frame': frame, 'version': CACHE_VERSION},
+                            sort_keys=True)
+        return hashlib.sha256(f"{content_hash}:{params}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.img')
+
+    def get(self, key):
+        """Return (meta dict, image bytes) for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = f.readline()
+                data = f.read()
+            meta = json.loads(header)
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return meta, data
+
+    def put(self, key, meta, data):
+        """Store image bytes and their meta dict under key, evicting if needed"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(json.dumps(meta).encode() + b'\n')
+                f.write(data)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing cache entry {path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        with self._lock:
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        """(path, size, mtime) of every entry on disk"""
+        entries = []
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.img'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # Evicted by another process
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of its cap.
+
+        Re-reads the directory so entries written by other processes count too.
+        """
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+            total -= size
+        self._total_bytes = total
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size of this instance"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'bytes': self._total_bytes}
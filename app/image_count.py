@@ -0,0 +1,91 @@
+# Author: Shady Rashwan
+# Background image counting for the GUI path check, cached per directory
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import shi
+
+class DirectoryCounts:
+    """Images directly inside each directory listed so far, keyed by path.
+
+    An entry holds the directory's mtime, its image count and its
+    subdirectories. Adding, removing or renaming a file changes the mtime
+    of the directory holding it, so while the mtime matches the cached
+    listing is still right and one stat replaces a full listing.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def list_directory(self, path):
+        """Return (image count, subdirectory paths) for path"""
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._entries.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+
+        count = 0
+        subdirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif shi.is_image_file(entry.name) and entry.is_file():
+                    count += 1
+        with self._lock:
+            self._entries[path] = (mtime, count, subdirs)
+        return count, subdirs
+
+class CountJob:
+    """A running or finished count of the images under one folder.
+
+    `count` grows as directories are listed; read `done` before `count` to
+    get the final total once the job is over.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.done = False
+        self.error = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop before the next directory"""
+        self._cancel.set()
+
+    def run(self, counts):
+        stack = [self.path]
+        try:
+            while stack and not self._cancel.is_set():
+                current = stack.pop()
+                try:
+                    images, subdirs = counts.list_directory(current)
+                except OSError:
+                    if current == self.path:
+                        raise
+                    continue  # Unreadable subfolder; scan_tree skips it too
+                self.count += images
+                stack.extend(subdirs)
+        except OSError as e:
+            self.error = str(e)
+        finally:
+            self.done = True
+
+class ImageCounter:
+    """Counts images under folders on background threads.
+
+    All jobs share one DirectoryCounts, so counting a folder again (or a
+    subfolder of one already counted) only re-lists directories that
+    changed since.
+    """
+    def __init__(self, max_workers=2):
+        self.counts = DirectoryCounts()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shi-count')
+
+    def count(self, path):
+        """Start counting the images under path and return its CountJob"""
+        job = CountJob(path)
+        self._executor.submit(job.run, self.counts)
+        return job
@@ -0,0 +1,70 @@
+# Author: Shady Rashwan
+# Header-only image metadata for layout and sorting
+
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+# EXIF tags read by the probe
+ORIENTATION_TAG = 0x0112
+DATETIME_TAG = 0x0132
+EXIF_IFD = 0x8769
+DATETIME_ORIGINAL_TAG = 0x9003
+
+# Orientations 5-8 turn the image a quarter turn, swapping width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Image.Transpose method that turns pixels upright, per EXIF orientation
+# (the same turns PIL's ImageOps.exif_transpose makes)
+ORIENTATION_TURNS = {2: 'FLIP_LEFT_RIGHT', 3: 'ROTATE_180', 4: 'FLIP_TOP_BOTTOM', 5: 'TRANSPOSE',
+                     6: 'ROTATE_270', 7: 'TRANSVERSE', 8: 'ROTATE_90'}
+
+# Pixel size as stored, EXIF orientation (1 = upright), capture time as a
+# POSIX timestamp (None if the file has none), colour mode and frame count
+ImageInfo = namedtuple('ImageInfo', ['width', 'height', 'orientation', 'captured', 'mode', 'frames'])
+
+def display_size(info):
+    """Width and height of the image once its orientation is applied"""
+    if info.orientation in TRANSPOSED_ORIENTATIONS:
+        return info.height, info.width
+    return info.width, info.height
+
+def _parse_exif_datetime(value):
+    try:
+        return datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S').timestamp()
+    except (TypeError, ValueError):
+        return None
+
+@lru_cache(maxsize=65536)
+def _probe(path, size, mtime, count_frames):
+    # size and mtime are only part of the cache key, so an edited file is probed again
+    from PIL import Image
+    with Image.open(path) as img:
+        exif = img.getexif()
+        orientation = exif.get(ORIENTATION_TAG, 1)
+        if orientation not in range(1, 9):
+            orientation = 1
+        captured = _parse_exif_datetime(exif.get_ifd(EXIF_IFD).get(DATETIME_ORIGINAL_TAG))
+        if captured is None:
+            captured = _parse_exif_datetime(exif.get(DATETIME_TAG))
+        frames = getattr(img, 'n_frames', 1) if count_frames else 1
+        return ImageInfo(img.width, img.height, orientation, captured, img.mode, frames)
+
+def probe_image(path, size=None, mtime=None, count_frames=False):
+    """Read an image's ImageInfo from its header without decoding pixels.
+
+    The file handle is closed before returning. Results are cached per
+    (path, size, mtime); pass size and mtime (e.g. from a scan_tree entry)
+    to skip the stat call. count_frames walks the frame headers of
+    multi-frame formats, which costs more than the rest of the probe.
+    """
+    if size is None or mtime is None:
+        stat = os.stat(path)
+        size, mtime = stat.st_size, stat.st_mtime
+    return _probe(path, size, mtime, count_frames)
+
+def natural_sort_key(name):
+    """Sort key that orders embedded numbers by value: img2 before img10"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
@@ -0,0 +1,116 @@
+# Author: Shady Rashwan
+# Background conversion jobs for the GUI, outliving a single Streamlit rerun
+
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import shi
+import progress as events
+
+# Job states: waiting for a worker, converting, cancel requested but the
+# current page not finished yet, and the three end states
+QUEUED, RUNNING, CANCELLING, CANCELLED, DONE, FAILED = (
+    'queued', 'running', 'cancelling', 'cancelled', 'done', 'failed')
+FINISHED_STATES = (CANCELLED, DONE, FAILED)
+
+class Job:
+    """One create_pdf_from_images run on a background thread.
+
+    Progress events are folded into a ProgressTracker under a lock; read
+    the job's state from another thread with snapshot().
+    """
+    def __init__(self, job_id, folder_path, preserve_originals, options):
+        self.id = job_id
+        self.folder_path = folder_path
+        self.preserve_originals = preserve_originals
+        self.options = options
+        self.state = QUEUED
+        self.results = []
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.tracker = events.ProgressTracker()
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def _on_event(self, event):
+        with self._lock:
+            self.tracker.update(event)
+
+    def cancel(self):
+        """Ask the job to stop; it does so before its next page"""
+        with self._lock:
+            if self.state in (QUEUED, RUNNING):
+                self.state = CANCELLING
+                self._cancel.set()
+
+    def run(self):
+        with self._lock:
+            if self._cancel.is_set():
+                self.state = CANCELLED
+                self.finished = time.time()
+                return
+            self.state = RUNNING
+            self.started = time.time()
+            self.tracker = events.ProgressTracker()
+        try:
+            results = shi.create_pdf_from_images(self.folder_path, preserve_originals=self.preserve_originals,
+                                                 progress=self._on_event, cancel=self._cancel, **self.options)
+            state, error = DONE, None
+        except shi.BuildCancelled as e:
+            results, state, error = e.results, CANCELLED, None
+        except Exception as e:
+            results, state, error = [], FAILED, f"{type(e).__name__}: {e}"
+        with self._lock:
+            self.results = results
+            self.state = state
+            self.error = error
+            self.finished = time.time()
+
+    def snapshot(self):
+        """Consistent copy of the job's state and progress as a plain dict"""
+        with self._lock:
+            tracker = self.tracker
+            end = self.finished or time.time()
+            elapsed = end - self.started if self.started else 0.0
+            return {
+                'id': self.id, 'folder': self.folder_path, 'state': self.state, 'error': self.error,
+                'results': list(self.results), 'elapsed': elapsed,
+                'images_done': tracker.images_done, 'images_total': tracker.images_total,
+                'fraction': 1.0 if self.state == DONE else tracker.fraction(),
+                'images_per_second': tracker.images_done / elapsed if elapsed > 0 else 0.0,
+                'current_folder': tracker.current_folder,
+                'folders': {folder: dict(info) for folder, info in tracker.folders.items()},
+            }
+
+class JobRunner:
+    """Runs Jobs on a small thread pool and keeps them until the process exits.
+
+    Conversions are heavy on CPU and disk, so by default one job runs at a
+    time and later ones wait their turn.
+    """
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shi-job')
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, folder_path, preserve_originals=False, **options):
+        """Queue a conversion; options go to shi.create_pdf_from_images. Returns the Job"""
+        with self._lock:
+            job = Job(next(self._ids), folder_path, preserve_originals, options)
+            self._jobs[job.id] = job
+        self._executor.submit(job.run)
+        return job
+
+    def get(self, job_id):
+        """The Job with this id, or None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self):
+        """Jobs that haven't finished yet, oldest first"""
+        with self._lock:
+            return [job for job in self._jobs.values() if job.state not in FINISHED_STATES]
@@ -0,0 +1,164 @@
+# Author: Shady Rashwan
+# A cap on how much decoded image data is held in memory at once
+
+import threading
+import time
+
+# Bytes PIL keeps per pixel of a decoded image (RGB is padded to 4)
+BYTES_PER_PIXEL = 4
+
+# Bytes per pixel of the RGB data reportlab's ImageReader hands the writer
+READER_BYTES_PER_PIXEL = 3
+
+# JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale
+DRAFT_SCALES = (1, 2, 4, 8)
+
+# Oversized images are shrunk in steps of this factor until they fit
+REDUCE_STEP = 0.75
+
+def draft_size(width, height, target):
+    """Size a JPEG decodes at in draft mode for target: the biggest DCT
+    reduction that still covers the target"""
+    scale = 1
+    for candidate in DRAFT_SCALES:
+        if width // candidate >= target[0] and height // candidate >= target[1]:
+            scale = candidate
+    return -(-width // scale), -(-height // scale)
+
+def decode_bytes(width, height, target=None, draft=False):
+    """Estimated peak memory of preparing a width x height image: the
+    decoded pixels (at draft scale for JPEGs with a target), the resampled
+    copy if there is a target, and the RGB data kept for the writer"""
+    if target and draft:
+        width, height = draft_size(width, height, target)
+    needed = width * height * BYTES_PER_PIXEL
+    target_width, target_height = target or (width, height)
+    if target:
+        needed += target_width * target_height * BYTES_PER_PIXEL
+    return needed + target_width * target_height * READER_BYTES_PER_PIXEL
+
+def held_bytes(width, height):
+    """Memory a prepared width x height image holds until its page is written"""
+    return width * height * (BYTES_PER_PIXEL + READER_BYTES_PER_PIXEL)
+
+def reduced_target(width, height, target, limit, draft=False, copies=1):
+    """Shrink target (or the full size) until `copies` decodes of it fit in
+    limit bytes; stops at 1/8 scale. Returns the new target size, or None
+    if shrinking doesn't pay: anything but a JPEG (draft) is decoded at
+    full size whatever the target, so only an image resampled to a target
+    anyway holds less when shrunk, and none fits once the full decode alone
+    is over the limit."""
+    if not draft and not target:
+        return None
+    target_width, target_height = target or (width, height)
+    scale = 1.0
+    while scale > 1 / 8:
+        scale *= REDUCE_STEP
+        reduced = (max(1, int(target_width * scale)), max(1, int(target_height * scale)))
+        if decode_bytes(width, height, reduced, draft) * copies <= limit:
+            return reduced
+    return None
+
+class Reservation:
+    """Bytes held against a MemoryBudget until resized or released"""
+    def __init__(self, budget, nbytes):
+        self.budget = budget
+        self.nbytes = nbytes
+
+    def resize(self, nbytes):
+        """Change the bytes held, e.g. shrink to what the decoded image kept"""
+        self.budget._resize(self, nbytes)
+
+    def release(self):
+        self.resize(0)
+
+class MemoryBudget:
+    """Bytes of decoded image data allowed in memory at once.
+
+    Every decode reserves its estimated size first (see decode_bytes) and
+    blocks while the budget is used up. Reservations are granted in ticket
+    order, so a prefetch thread working ahead can never take the budget the
+    page the writer is waiting for needs. A single request larger than the
+    whole budget is granted once nothing else is held, so it runs alone
+    rather than never; callers shrink such images first where that helps
+    (reduced_target) and otherwise reserve the whole budget.
+    """
+    def __init__(self, limit_mb):
+        self.limit = int(limit_mb * 1024 * 1024)
+        self.used = 0
+        self.peak = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.reduced = 0
+        self._issued = 0
+        self._serving = 0
+        self._finished = set()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def ticket(self):
+        """A place in line; pass it to reserve() (or skip()) exactly once"""
+        with self._cond:
+            ticket = self._issued
+            self._issued += 1
+            return ticket
+
+    def reserve(self, nbytes, ticket=None, reduced=False):
+        """Block until nbytes fit (and it's `ticket`'s turn); returns a
+        Reservation. Pass reduced=True for an image shrunk to fit, to count it."""
+        with self._cond:
+            if not self._can_reserve(nbytes, ticket):
+                self.waits += 1
+                start = time.perf_counter()
+                while not self._can_reserve(nbytes, ticket):
+                    self._cond.wait()
+                self.wait_seconds += time.perf_counter() - start
+            if ticket is not None:
+                self._finish(ticket)
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+            self.reduced += reduced
+            self._cond.notify_all()
+        return Reservation(self, nbytes)
+
+    def skip(self, ticket):
+        """Give up a ticket without reserving (the image needed no decode,
+        failed, or was cancelled); a no-op if it was already used"""
+        with self._cond:
+            self._finish(ticket)
+            self._cond.notify_all()
+
+    def close(self):
+        """Stop enforcing the budget: waiting and later reservations go
+        straight through (used when the pages they're for won't be written)"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _can_reserve(self, nbytes, ticket):
+        if self._closed:
+            return True
+        if ticket is not None and ticket != self._serving:
+            return False
+        return self.used + nbytes <= self.limit or self.used == 0
+
+    def _finish(self, ticket):
+        if ticket >= self._serving:
+            self._finished.add(ticket)
+        while self._serving in self._finished:
+            self._finished.remove(self._serving)
+            self._serving += 1
+
+    def _resize(self, reservation, nbytes):
+        with self._cond:
+            self.used += nbytes - reservation.nbytes
+            reservation.nbytes = nbytes
+            self.peak = max(self.peak, self.used)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Peak bytes reserved, how often and how long decodes waited, and
+        how many images were decoded at reduced scale to fit"""
+        with self._cond:
+            return {'limit_bytes': self.limit, 'peak_bytes': self.peak, 'waits': self.waits,
+                    'wait_seconds': self.wait_seconds, 'reduced': self.reduced}
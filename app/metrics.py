@@ -0,0 +1,187 @@
+# Author: Shady Rashwan
+# Run metrics collected from progress events, saved as JSON or a Prometheus textfile
+
+import json
+import os
+import time
+from collections import defaultdict
+import progress as events
+
+METRICS_VERSION = 1
+
+# Histogram bucket upper bounds: folder build wall time in seconds, and
+# seconds spent decoding (and resampling) each megapixel of an image
+FOLDER_SECONDS_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+DECODE_SECONDS_PER_MP_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2)
+
+# Metric names in the Prometheus textfile start with this
+PREFIX = 'shi'
+
+# Files ending in this are written in the Prometheus text format, anything else as JSON
+PROMETHEUS_SUFFIX = '.prom'
+
+def image_format(path):
+    """Format label of an image file, from its extension (jpg -> jpeg)"""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return {'jpg': 'jpeg', 'tif': 'tiff'}.get(extension, extension)
+
+class Histogram:
+    """Observations counted into cumulative buckets, as Prometheus does:
+    each bucket counts the values at or under its bound"""
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        return {'buckets': {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+                'count': self.count, 'sum': self.sum}
+
+class RunMetrics:
+    """Counters and histograms for one run, built from progress events.
+
+    Pass an instance as the progress callback of create_pdf_from_images
+    (worker processes' events are relayed to it, so --jobs runs are counted
+    too); every event is then forwarded to `on_event`. Counts images and
+    unreadable images per format, pages, bytes read and written, folders
+    per outcome, HEIC files skipped for lack of support, and histograms of
+    folder wall time and decode time per megapixel.
+    """
+    def __init__(self, on_event=None):
+        self.on_event = on_event
+        self.started = time.time()
+        self.finished = None
+        self.images = defaultdict(int)  # format -> images decoded
+        self.image_failures = defaultdict(int)  # format -> images that couldn't be read
+        self.pages = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.folders = defaultdict(int)  # 'done', 'skipped', 'empty' or 'error' -> folders
+        self.root_failures = 0
+        self.heic_skipped = 0
+        self.folder_seconds = Histogram(FOLDER_SECONDS_BUCKETS)
+        self.decode_seconds_per_mp = Histogram(DECODE_SECONDS_PER_MP_BUCKETS)
+        self.folder_results = []
+
+    def __call__(self, event):
+        self.update(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def update(self, event):
+        if isinstance(event, events.ImageDecoded):
+            if event.frame == 0:
+                counter = self.images if event.ok else self.image_failures
+                counter[image_format(event.file)] += 1
+                self.bytes_read += event.bytes
+            # Pages that needed no decode (shared duplicates) report 0 seconds
+            if event.ok and event.pixels and event.seconds > 0:
+                self.decode_seconds_per_mp.observe(event.seconds / (event.pixels / 1e6))
+        elif isinstance(event, events.PageWritten):
+            self.pages += 1
+        elif isinstance(event, events.FolderFinished):
+            result = event.result
+            if result['error']:
+                state = 'error'
+            elif result['skipped']:
+                state = 'skipped'
+            else:
+                state = 'done' if result['pdf_file'] else 'empty'
+            self.folders[state] += 1
+            self.heic_skipped += result['heic_skipped']
+            if state == 'done':
+                self.bytes_written += result['pdf_bytes']
+                self.folder_seconds.observe(result['seconds'])
+            self.folder_results.append({'folder': event.folder, 'state': state, 'seconds': result['seconds'],
+                                        'pages': result['pages'], 'source_bytes': result['source_bytes'],
+                                        'pdf_bytes': result['pdf_bytes']})
+
+    def finish(self):
+        """Mark the run as over (its duration ends here)"""
+        self.finished = time.time()
+
+    def seconds(self):
+        return (self.finished or time.time()) - self.started
+
+    def as_dict(self):
+        """The JSON summary"""
+        return {'version': METRICS_VERSION, 'started': self.started, 'finished': self.finished,
+                'seconds': self.seconds(), 'images': dict(self.images),
+                'image_failures': dict(self.image_failures), 'pages': self.pages,
+                'bytes_read': self.bytes_read, 'bytes_written': self.bytes_written,
+                'folders': dict(self.folders), 'root_failures': self.root_failures,
+                'heic_skipped': self.heic_skipped,
+                'histograms': {'folder_seconds': self.folder_seconds.as_dict(),
+                               'decode_seconds_per_megapixel': self.decode_seconds_per_mp.as_dict()},
+                'per_folder': self.folder_results}
+
+    def as_prometheus(self):
+        """The metrics in the Prometheus text format, for node-exporter's
+        textfile collector. Counters cover this run only; a new run starts
+        them again, which Prometheus treats as a counter reset."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                lines.append(f'{PREFIX}_{name}{suffix}{{{label_text}}} {_number(value)}' if label_text
+                             else f'{PREFIX}_{name}{suffix} {_number(value)}')
+
+        def histogram(name, help_text, hist):
+            samples = [('_bucket', {'le': str(bound)}, count) for bound, count in zip(hist.buckets, hist.counts)]
+            samples += [('_bucket', {'le': '+Inf'}, hist.count), ('_sum', {}, hist.sum), ('_count', {}, hist.count)]
+            metric(name, 'histogram', help_text, samples)
+
+        metric('images_total', 'counter', "Images converted, by format",
+               [('', {'format': name}, count) for name, count in sorted(self.images.items())])
+        metric('image_failures_total', 'counter', "Images that could not be read, by format",
+               [('', {'format': name}, count) for name, count in sorted(self.image_failures.items())])
+        metric('pages_total', 'counter', "PDF pages written", [('', {}, self.pages)])
+        metric('read_bytes_total', 'counter', "Bytes of source images converted", [('', {}, self.bytes_read)])
+        metric('written_bytes_total', 'counter', "Bytes of PDFs written", [('', {}, self.bytes_written)])
+        metric('folders_total', 'counter', "Folders looked at, by outcome",
+               [('', {'state': state}, count) for state, count in sorted(self.folders.items())])
+        metric('root_failures_total', 'counter', "Roots that were missing or could not be converted",
+               [('', {}, self.root_failures)])
+        metric('heic_skipped_total', 'counter', "HEIC files skipped because HEIC support is missing",
+               [('', {}, self.heic_skipped)])
+        histogram('folder_seconds', "Wall time of each folder build", self.folder_seconds)
+        histogram('decode_seconds_per_megapixel', "Decode time per megapixel of each image",
+                  self.decode_seconds_per_mp)
+        metric('last_run_duration_seconds', 'gauge', "Wall time of the last run", [('', {}, self.seconds())])
+        metric('last_run_timestamp_seconds', 'gauge', "When the last run finished (Unix time)",
+               [('', {}, self.finished or time.time())])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Save to path, as a Prometheus textfile if it ends in .prom and as
+        JSON otherwise. The file is replaced in one step, so a collector
+        never reads it half written."""
+        if path.endswith(PROMETHEUS_SUFFIX):
+            text = self.as_prometheus()
+        else:
+            text = json.dumps(self.as_dict(), indent=2) + '\n'
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(text)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
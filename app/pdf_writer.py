@@ -0,0 +1,202 @@
+# Author: Shady Rashwan
+# Minimal streaming PDF writer for image-only documents
+
+import os
+import zlib
+from collections import namedtuple
+
+# PDF colour space for each image mode the writer embeds
+COLOR_SPACES = {'L': 'DeviceGray', 'RGB': 'DeviceRGB', 'CMYK': 'DeviceCMYK'}
+
+# Rough size of a page's own objects (page dict, content stream, xref entries)
+PAGE_OVERHEAD = 512
+
+# An image XObject ready to write: its dictionary entries, encoded stream
+# and optional soft mask (another EncodedImage holding the alpha channel)
+EncodedImage = namedtuple('EncodedImage', ['width', 'height', 'color_space', 'filter', 'data', 'smask', 'decode'])
+
+# An image already written to the file, to draw again without another copy
+# (see PdfStreamWriter.share_image): its object number and stream length
+ImageRef = namedtuple('ImageRef', ['object_id', 'nbytes'])
+
+def encode_image(source, compress_level=6):
+    """Turn a drawImage source into an EncodedImage.
+
+    source is a JPEG file path, an EncodedImage, or a reportlab ImageReader.
+    JPEG data (from a path or a reader wrapping JPEG bytes) is copied through
+    as a DCTDecode stream without decoding; anything else is compressed with
+    Flate, with alpha split out into a soft mask.
+    """
+    if isinstance(source, EncodedImage):
+        return source
+
+    if isinstance(source, str):
+        from PIL import Image
+        with Image.open(source) as img:
+            width, height, mode = img.width, img.height, img.mode
+            is_jpeg = img.format == 'JPEG'
+        if is_jpeg and mode in COLOR_SPACES:
+            with open(source, 'rb') as f:
+                return _jpeg_image(width, height, mode, f.read())
+        from reportlab.lib.utils import ImageReader
+        source = ImageReader(source)
+
+    jpeg_fh = source.jpeg_fh()
+    if jpeg_fh is not None and source._image.mode in COLOR_SPACES:
+        width, height = source.getSize()
+        return _jpeg_image(width, height, source._image.mode, jpeg_fh.read())
+
+    raw = source.getRGBData()
+    width, height = source.getSize()
+    smask = None
+    if source._dataA is not None:
+        alpha = source._dataA
+        smask = EncodedImage(width, height, 'DeviceGray', 'FlateDecode',
+                             zlib.compress(alpha.getRGBData(), compress_level), None, None)
+    return EncodedImage(width, height, COLOR_SPACES[source.mode], 'FlateDecode',
+                        zlib.compress(raw, compress_level), smask, None)
+
+def _jpeg_image(width, height, mode, data):
+    # Adobe CMYK JPEGs store inverted values; PDF viewers expect a Decode array
+    decode = '[1 0 1 0 1 0 1 0]' if mode == 'CMYK' else None
+    return EncodedImage(width, height, COLOR_SPACES[mode], 'DCTDecode', data, None, decode)
+
+class PdfStreamWriter:
+    """Write an image-only PDF page by page with constant memory.
+
+    Mirrors the subset of reportlab's Canvas that shi uses (drawImage,
+    saveState/transform/restoreState, showPage, save), so it can stand in
+    for a Canvas. Every image and page is written to disk as soon as it is
+    complete; only the byte offsets of the objects are kept, so memory does
+    not grow with the page count.
+    """
+    def __init__(self, filename, pagesize, compress_level=6):
+        self.filename = filename
+        self.page_width, self.page_height = pagesize
+        self.compress_level = compress_level
+        # A file object works too (size_limit measures a document's structure that way)
+        self._file = open(filename, 'wb') if isinstance(filename, str) else filename
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 3  # 1 is the catalog, 2 the page tree; both written last
+        self._page_images = []
+        self._page_ops = []
+        self._shared = {}  # share_image key -> ImageRef
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self._file.write(data)
+
+    def _new_id(self):
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _write_object(self, object_id, body, stream=None):
+        self._offsets[object_id] = self._file.tell()
+        self._write(f'{object_id} 0 obj\n'.encode())
+        if stream is None:
+            self._write(body.encode() + b'\nendobj\n')
+        else:
+            self._write(body.encode() + b'\nstream\n')
+            self._write(stream)
+            self._write(b'\nendstream\nendobj\n')
+
+    def _write_image(self, image):
+        smask_id = self._write_image(image.smask) if image.smask is not None else None
+        object_id = self._new_id()
+        entries = [f'/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height}',
+                   f'/ColorSpace /{image.color_space} /BitsPerComponent 8',
+                   f'/Filter /{image.filter} /Length {len(image.data)}']
+        if image.decode:
+            entries.append(f'/Decode {image.decode}')
+        if smask_id is not None:
+            entries.append(f'/SMask {smask_id} 0 R')
+        self._write_object(object_id, '<< ' + ' '.join(entries) + ' >>', image.data)
+        return object_id
+
+    def tell(self):
+        """Bytes written to the file so far"""
+        return self._file.tell()
+
+    def projected_size(self, extra_bytes=0):
+        """Estimated final file size if extra_bytes more image data were added"""
+        objects = self._next_id + 2
+        return self.tell() + extra_bytes + PAGE_OVERHEAD * (len(self._page_ids) + 1) + objects * 20 + 256
+
+    def encode_image(self, source):
+        """Encode a drawImage source ahead of drawing (e.g. to measure it)"""
+        return encode_image(source, self.compress_level)
+
+    def share_image(self, key, source):
+        """An ImageRef to draw instead of source. The image is written the
+        first time `key` is seen; later calls with the same key return the
+        same XObject, so pages showing one image embed it once."""
+        ref = self._shared.get(key)
+        if ref is None:
+            encoded = self.encode_image(source)
+            ref = self._shared[key] = ImageRef(self._write_image(encoded), len(encoded.data))
+        return ref
+
+    def has_image(self, key):
+        """Whether an image was already written under this share_image key"""
+        return key in self._shared
+
+    def drawImage(self, image, x, y, width, height):
+        """Write image as an XObject now (unless it is an ImageRef) and place it on the current page"""
+        if isinstance(image, ImageRef):
+            object_id = image.object_id
+        else:
+            object_id = self._write_image(self.encode_image(image))
+        name = f'Im{object_id}'
+        self._page_images.append((name, object_id))
+        self._page_ops.append(f'q {width:.4f} 0 0 {height:.4f} {x:.4f} {y:.4f} cm /{name} Do Q')
+
+    def saveState(self):
+        self._page_ops.append('q')
+
+    def restoreState(self):
+        self._page_ops.append('Q')
+
+    def transform(self, a, b, c, d, e, f):
+        """Concatenate a matrix to the current transformation, like Canvas.transform"""
+        self._page_ops.append(f'{a:.4f} {b:.4f} {c:.4f} {d:.4f} {e:.4f} {f:.4f} cm')
+
+    def showPage(self):
+        """Finish the current page and write it out"""
+        content = '\n'.join(self._page_ops).encode()
+        content_id = self._new_id()
+        self._write_object(content_id, f'<< /Length {len(content)} >>', content)
+
+        xobjects = ' '.join(f'/{name} {object_id} 0 R' for name, object_id in self._page_images)
+        page_id = self._new_id()
+        self._write_object(page_id, f'<< /Type /Page /Parent 2 0 R '
+                                    f'/MediaBox [0 0 {self.page_width:.4f} {self.page_height:.4f}] '
+                                    f'/Resources << /XObject << {xobjects} >> >> '
+                                    f'/Contents {content_id} 0 R >>')
+        self._page_ids.append(page_id)
+        self._page_images = []
+        self._page_ops = []
+
+    def save(self):
+        """Write the page tree, catalog and cross-reference table and close the file"""
+        if self._page_ops:
+            self.showPage()
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self._page_ids)
+        self._write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>')
+        self._write_object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref_offset = self._file.tell()
+        size = self._next_id
+        lines = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+        for object_id in range(1, size):
+            lines.append(f'{self._offsets[object_id]:010d} 00000 n \n')
+        self._write(''.join(lines).encode())
+        self._write(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode())
+        self._file.close()
+
+    def abort(self):
+        """Close and remove a partially written file"""
+        self._file.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
@@ -0,0 +1,126 @@
+# Author: Shady Rashwan
+# Typed progress events for PDF builds, and helpers to render them
+
+import time
+from collections import namedtuple
+
+# Events passed to the `progress` callback of shi.create_pdf_from_images.
+# `time` is a time.time() stamp taken where the event happened, so events
+# relayed from worker processes keep their real timing.
+
+# The tree has been scanned: how many folders and images will be looked at
+ScanFinished = namedtuple('ScanFinished', ['root', 'folders', 'images', 'source_bytes', 'time'])
+# A folder's build is starting (images and source_bytes are what it will read)
+FolderStarted = namedtuple('FolderStarted', ['folder', 'images', 'source_bytes', 'time'])
+# One frame of an image was decoded and prepared; bytes is the source file
+# size for its first frame and 0 for later frames, ok is False if unreadable,
+# pixels is the frame's size as stored (0 if unreadable)
+ImageDecoded = namedtuple('ImageDecoded', ['folder', 'file', 'frame', 'bytes', 'seconds', 'ok', 'pixels', 'time'])
+# A page was added to pdf_file; bytes is what the page added to the file so
+# far (0 for the reportlab canvas, which writes everything on save)
+PageWritten = namedtuple('PageWritten', ['folder', 'pdf_file', 'page', 'bytes', 'time'])
+# A folder is done; result is its shi result dict (skipped/error included)
+FolderFinished = namedtuple('FolderFinished', ['folder', 'result', 'time'])
+
+def emit(progress, event_type, *fields):
+    """Call the progress callback (if any) with a new event stamped now"""
+    if progress is not None:
+        progress(event_type(*fields, time.time()))
+
+class ProgressTracker:
+    """Fold progress events into running totals.
+
+    Pass an instance (or its update method) as the progress callback, then
+    read the counters; `folders` maps each folder seen to a dict with its
+    image count, images done, pages and state ('running', 'done', 'skipped'
+    or 'error'). Optionally forwards every event to `on_event` after
+    updating.
+    """
+    def __init__(self, on_event=None):
+        self.on_event = on_event
+        self.started = time.time()
+        self.images_total = 0
+        self.images_done = 0
+        self.bytes_read = 0
+        self.pages = 0
+        self.pdf_bytes = 0
+        self.decode_seconds = 0.0
+        self.folders = {}
+        self.current_folder = None
+        self.last_event = None
+
+    def __call__(self, event):
+        self.update(event)
+
+    def update(self, event):
+        if isinstance(event, ScanFinished):
+            self.images_total = event.images
+        elif isinstance(event, FolderStarted):
+            self.folders[event.folder] = {'images': event.images, 'done': 0, 'pages': 0, 'state': 'running'}
+            self.current_folder = event.folder
+        elif isinstance(event, ImageDecoded):
+            self.decode_seconds += event.seconds
+            if event.frame == 0:
+                self.images_done += 1
+                self.bytes_read += event.bytes
+                self._folder(event.folder)['done'] += 1
+        elif isinstance(event, PageWritten):
+            self.pages += 1
+            self._folder(event.folder)['pages'] += 1
+        elif isinstance(event, FolderFinished):
+            result = event.result
+            folder = self._folder(event.folder)
+            folder['state'] = 'error' if result['error'] else 'skipped' if result['skipped'] else 'done'
+            if result['skipped']:
+                # Skipped folders never report their images; count them as done
+                self.images_done += folder['images'] - folder['done']
+                folder['done'] = folder['images']
+            self.pdf_bytes += result['pdf_bytes']
+        self.last_event = event
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def _folder(self, folder):
+        return self.folders.setdefault(folder, {'images': 0, 'done': 0, 'pages': 0, 'state': 'running'})
+
+    def fraction(self):
+        """Share of the images done so far, 0.0 to 1.0"""
+        if not self.images_total:
+            return 0.0
+        return min(1.0, self.images_done / self.images_total)
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def images_per_second(self):
+        elapsed = self.elapsed()
+        return self.images_done / elapsed if elapsed > 0 else 0.0
+
+    def megabytes_per_second(self):
+        elapsed = self.elapsed()
+        return self.bytes_read / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+
+class ConsoleProgress:
+    """Progress bar for the command line, driven by progress events"""
+    def __init__(self):
+        from tqdm import tqdm
+        self._tqdm = tqdm
+        self.bar = None
+        self.tracker = ProgressTracker()
+
+    def __call__(self, event):
+        self.tracker.update(event)
+        if isinstance(event, ScanFinished):
+            self.bar = self._tqdm(total=event.images, desc="Creating PDFs", unit="img")
+        elif self.bar is None:
+            return
+        elif isinstance(event, ImageDecoded) and event.frame == 0:
+            self.bar.update(1)
+        elif isinstance(event, FolderFinished) and event.result['skipped']:
+            self.bar.update(self.tracker.folders[event.folder]['images'])
+        if isinstance(event, (ImageDecoded, FolderFinished)):
+            self.bar.set_postfix_str(f"{self.tracker.megabytes_per_second():.1f} MB/s", refresh=False)
+
+    def close(self):
+        if self.bar is not None:
+            self.bar.close()
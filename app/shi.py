@@ -7,35 +7,240 @@
 ##############################################
 
 import os
-import math
+import io
+import json
 import sys
-from PIL import Image
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from tqdm import tqdm
-
-# Try to import pillow_heif, and provide a helpful error message if it fails
-try:
-    from pillow_heif import register_heif_opener
-    # Register HEIF opener
-    register_heif_opener()
-    HEIC_SUPPORT = True
-except ImportError:
-    HEIC_SUPPORT = False
-    print("\n===== ERROR: HEIC Support Not Available =====")
-    print("The pillow_heif package is not installed correctly.")
-    print("HEIC files (iPhone photos) will not be processed.")
-    print("\nTo fix this issue:")
-    print("1. Run: pip install pillow_heif --force-reinstall")
-    print("2. Or see TROUBLESHOOTING.txt for more options")
-    print("==================================\n")
+import time
+import argparse
+from collections import defaultdict, namedtuple, deque
+from contextlib import nullcontext, redirect_stdout
+import duplicates
+import image_cache
+import image_probe
+import memory_budget
+import pdf_writer
+import progress as events
+import tracing
+
+# PIL, reportlab and pillow_heif are imported on first use rather than
+# here, so importing shi (the GUI, every CLI call) stays fast
+
+# None until the first HEIC file is seen, then whether pillow_heif loaded
+_heic_support = None
+
+def heic_support():
+    """Register pillow_heif's opener with PIL the first time it's needed.
+
+    Returns False (after printing how to fix it, once) if pillow_heif
+    isn't installed.
+    """
+    global _heic_support
+    if _heic_support is None:
+        try:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+            _heic_support = True
+        except ImportError:
+            _heic_support = False
+            print("\n===== ERROR: HEIC Support Not Available =====")
+            print("The pillow_heif package is not installed correctly.")
+            print("HEIC files (iPhone photos) will not be processed.")
+            print("\nTo fix this issue:")
+            print("1. Run: pip install pillow_heif --force-reinstall")
+            print("2. Or see TROUBLESHOOTING.txt for more options")
+            print("==================================\n")
+    return _heic_support
+
+def _reportlab():
+    """Import and configure reportlab on first use; returns its canvas module"""
+    from reportlab import rl_config
+    from reportlab.pdfgen import canvas
+    # Write image streams as binary rather than ASCII85 text: a quarter smaller,
+    # and far faster when reportlab's optional C accelerator isn't installed
+    rl_config.useA85 = 0
+    return canvas
+
+def _image_reader(source):
+    from reportlab.lib.utils import ImageReader
+    _reportlab()
+    return ImageReader(source)
 
 # Image extensions supported
 IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.heic']
 
-# Note: HEIF opener registration is now handled in the try/except block above
+# JPEGs are copied into the PDF byte for byte by reportlab, so they are drawn
+# from their path. Everything else is decoded with PIL ahead of time and
+# drawn from memory, never written back to disk
+PASSTHROUGH_EXTENSIONS = ['.jpg', '.jpeg']
+
+# Formats that can hold several frames; each frame becomes its own page
+MULTI_FRAME_EXTENSIONS = ['.tiff', '.gif']
+
+# Lossy sources: when these are downsampled they are re-encoded as JPEG
+LOSSY_EXTENSIONS = ['.jpg', '.jpeg', '.heic']
+
+# How many images a folder build decodes ahead of the page being written
+PREFETCH_IMAGES = 4
+
+# Suffix of PDFs still being written (see write_volumes)
+TEMP_SUFFIX = '.tmp'
+
+# Written next to each PDF in incremental mode: the inputs and settings it was built from
+MANIFEST_NAME = '.shi-manifest.json'
+MANIFEST_VERSION = 3
+
+# Every image is fitted onto a page of this size (in points): US Letter,
+# reportlab's pagesizes.letter
+PAGE_SIZE = (612.0, 792.0)
+
+# Filters accepted by the 'resample' setting: name -> PIL.Image.Resampling member
+RESAMPLE_FILTERS = {
+    'nearest': 'NEAREST',
+    'box': 'BOX',
+    'bilinear': 'BILINEAR',
+    'hamming': 'HAMMING',
+    'bicubic': 'BICUBIC',
+    'lanczos': 'LANCZOS',
+}
+
+# Settings that change what ends up in the PDF. With dpi=None images are
+# embedded at full resolution; otherwise each one is resampled to the pixel
+# size it occupies on the page at that DPI, and lossy sources are re-encoded
+# as JPEG at jpeg_quality. max_pages / max_volume_mb split a folder's PDF
+# into volumes (<folder>_part001.pdf, ...) of at most that many pages / MB.
+# max_output_mb keeps a folder's whole PDF under that size by re-encoding
+# each page at the best JPEG quality (at most jpeg_quality) and scale that fit.
+# near_duplicates leaves out images whose dHash is within that many bits of
+# an earlier page's (see duplicates.find_duplicates)
+DEFAULT_SETTINGS = {'dpi': None, 'resample': 'lanczos', 'jpeg_quality': 90,
+                    'max_pages': None, 'max_volume_mb': None, 'max_output_mb': None, 'sort': 'name',
+                    'near_duplicates': None}
+
+# The settings that affect how a single image is prepared (the cache key)
+IMAGE_SETTINGS = ['dpi', 'resample', 'jpeg_quality']
+
+# Page orders accepted by the 'sort' setting: file name as plain text, file
+# name with numbers compared by value (img2 before img10), or EXIF capture
+# time (falling back to the file's mtime)
+SORT_ORDERS = ['name', 'natural', 'captured']
+
+# PDF writers, selectable per run. Both take the Canvas calls shi makes
+# (drawImage, saveState/transform/restoreState, showPage, save). 'direct' is
+# pdf_writer.PdfStreamWriter, which writes the page and image objects itself:
+# JPEG bytes go in untouched as DCTDecode, everything else is Flate
+# compressed, and each page is flushed to disk once it is finished
+PDF_BACKENDS = ['reportlab', 'direct']
+DEFAULT_BACKEND = 'reportlab'
+
+# For each EXIF orientation, how the unit square of the stored image maps
+# onto the upright unit square on the page: (s_u, s_v, s_0, t_u, t_v, t_0)
+# meaning s = s_u*u + s_v*v + s_0 and t = t_u*u + t_v*v + t_0
+ORIENTATION_TRANSFORMS = {
+    1: (1, 0, 0, 0, 1, 0),
+    2: (-1, 0, 1, 0, 1, 0),   # mirrored
+    3: (-1, 0, 1, 0, -1, 1),  # upside down
+    4: (1, 0, 0, 0, -1, 1),   # flipped vertically
+    5: (0, -1, 1, -1, 0, 1),  # transposed
+    6: (0, 1, 0, -1, 0, 1),   # needs a quarter turn clockwise
+    7: (0, 1, 0, 1, 0, 0),    # transversed
+    8: (0, -1, 1, 1, 0, 0),   # needs a quarter turn counter-clockwise
+}
+
+# One image found by scan_tree: full path, file name, size in bytes and mtime
+ImageEntry = namedtuple('ImageEntry', ['path', 'name', 'size', 'mtime'])
+
+# An image ready to draw: what c.drawImage takes (a path or an ImageReader),
+# its embedded pixel size, its original pixel size before downsampling (both
+# as stored, before orientation), how many frames its file holds, its
+# EXIF orientation, which is applied when the page is drawn, the
+# memory_budget.Reservation covering it (None without a memory budget), and
+# a key naming the image when other pages show it too (see
+# iter_shared_duplicates), so the PDF holds it once
+PreparedImage = namedtuple('PreparedImage', ['source', 'width', 'height', 'original_width', 'original_height',
+                                             'frames', 'orientation', 'reservation', 'key'],
+                           defaults=(None, None))
+
+class BuildCancelled(Exception):
+    """A build was stopped through its cancel event.
+
+    `results` holds the result dicts of the folders finished before that.
+    """
+    def __init__(self, folder_path=None, results=()):
+        super().__init__(f"Cancelled while building {folder_path}" if folder_path else "Cancelled")
+        self.folder_path = folder_path
+        self.results = list(results)
+
+def make_settings(**overrides):
+    """Return DEFAULT_SETTINGS updated with overrides, checking the values"""
+    settings = dict(DEFAULT_SETTINGS)
+    for key, value in overrides.items():
+        if key not in settings:
+            raise ValueError(f"Unknown setting: {key}")
+        settings[key] = value
+    if settings['resample'] not in RESAMPLE_FILTERS:
+        raise ValueError(f"Unknown resample filter: {settings['resample']} "
+                         f"(choose from {', '.join(RESAMPLE_FILTERS)})")
+    if settings['sort'] not in SORT_ORDERS:
+        raise ValueError(f"Unknown sort order: {settings['sort']} (choose from {', '.join(SORT_ORDERS)})")
+    for key in ['dpi', 'max_pages', 'max_volume_mb', 'max_output_mb']:
+        if settings[key] is not None and settings[key] <= 0:
+            raise ValueError(f"{key} must be a positive number")
+    if settings['near_duplicates'] is not None and not 0 <= settings['near_duplicates'] < duplicates.DHASH_BITS:
+        raise ValueError(f"near_duplicates must be between 0 and {duplicates.DHASH_BITS - 1} bits")
+    return settings
+
+def _image_settings(settings):
+    return {key: settings[key] for key in IMAGE_SETTINGS}
+
+def is_image_file(file_name):
+    """Check whether a file name has one of the supported image extensions"""
+    return file_name.lower().endswith(tuple(IMAGE_EXTENSIONS))
+
+def scan_tree(folder_path):
+    """Walk folder_path once and index the images of every folder in it.
+
+    Returns a dict mapping each folder to the sorted list of ImageEntry
+    tuples found directly inside it. Each directory is listed exactly once
+    with os.scandir, so the cost is linear in the size of the tree.
+    Subfolders come before their parent so PDFs are built bottom-up.
+    """
+    visited = []
+    index = {}
+    stack = [folder_path]
+    while stack:
+        current = stack.pop()
+        try:
+            entries, subfolders = list_folder(current)
+        except OSError as e:
+            print(f"Error scanning folder {current}: {e}")
+            entries, subfolders = [], []
+        index[current] = entries
+        visited.append(current)
+        # Sorted push order means siblings pop in reverse; reversing the
+        # visit order at the end yields children-first in sorted order
+        stack.extend(sorted(subfolders))
+
+    return {folder: index[folder] for folder in reversed(visited)}
+
+def list_folder(folder_path):
+    """List one folder with a single os.scandir: returns (sorted ImageEntry
+    list of the images directly inside it, subfolder paths)"""
+    entries = []
+    subfolders = []
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+            elif entry.is_file() and is_image_file(entry.name):
+                stat = entry.stat()
+                entries.append(ImageEntry(entry.path, entry.name, stat.st_size, stat.st_mtime))
+    entries.sort()
+    return entries, subfolders
 
 def load_image(image_file_path):
+    from PIL import Image
+    if image_file_path.lower().endswith('.heic'):
+        heic_support()
     try:
         # Load the image
         image = Image.open(image_file_path)
@@ -45,109 +250,1089 @@ def load_image(image_file_path):
         print(f"Error loading image {image_file_path}: {e}")
         return None
 
-def convert_to_png(image_file, image_files, temp_files=[]):
-    # Convert image to PNG
-    if image_file.lower().endswith('.heic'):
-        # Check if HEIC support is available
-        if not HEIC_SUPPORT:
-            print(f"Skipping HEIC file (no support): {image_file}")
-            return
-            
+def target_pixel_size(width, height, dpi, page_size=PAGE_SIZE, orientation=1):
+    """Pixel size needed to fill the image's spot on the page at dpi.
+
+    width and height are the stored pixel size; the fit on the page takes
+    the EXIF orientation into account. Returns None when the image is
+    already no bigger than that.
+    """
+    page_width, page_height = page_size
+    display_width, display_height = width, height
+    if orientation in image_probe.TRANSPOSED_ORIENTATIONS:
+        display_width, display_height = height, width
+    scale = min(page_width / display_width, page_height / display_height) * dpi / 72
+    if scale >= 1:
+        return None
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def prepare_image(image_file, settings=None, cache=None, decoder=None, budget=None, ticket=None):
+    """Return a PreparedImage for image_file, or None if it can't be used.
+
+    The size, orientation and frame count come from a header-only probe.
+    JPEGs that need no downsampling are embedded straight from their path.
+    Everything else (HEIC included) is decoded here, resampled to the target
+    DPI if one is set, and wrapped in an ImageReader holding the raw pixel
+    data, so the work can run on a prefetch thread instead of inside
+    c.drawImage. With a ConversionCache, HEIC files and images that need
+    downsampling are looked up by content hash before any decode work.
+    With a decode_pool.DecodePool as `decoder`, single-frame images are
+    decoded and resampled in its worker processes.
+    With a memory_budget.MemoryBudget, decoding waits until the image's
+    estimated memory is reserved (in `ticket` order, see MemoryBudget), and
+    an image too big for the whole budget is decoded at a reduced size if
+    that makes it fit (and otherwise alone, at the size asked). The
+    reservation comes back on the PreparedImage; release it once the page
+    is written.
+    """
+    try:
+        return _prepare_image(image_file, settings or DEFAULT_SETTINGS, cache, decoder, budget, ticket)
+    finally:
+        if ticket is not None:
+            budget.skip(ticket)  # No decode happened (or it failed); let the next image through
+
+def _prepare_image(image_file, settings, cache, decoder, budget, ticket):
+    dpi = settings['dpi']
+    lower = image_file.lower()
+    if lower.endswith('.heic') and not heic_support():
+        return None
+
+    try:
+        with tracing.span('probe', file=image_file):
+            info = image_probe.probe_image(image_file,
+                                           count_frames=lower.endswith(tuple(MULTI_FRAME_EXTENSIONS)))
+    except Exception as e:
+        print(f"Error loading image {image_file}: {e}")
+        return None
+    target = dpi and target_pixel_size(info.width, info.height, dpi, orientation=info.orientation)
+
+    if lower.endswith(tuple(PASSTHROUGH_EXTENSIONS)) and not target:
+        return PreparedImage(image_file, info.width, info.height, info.width, info.height, 1, info.orientation)
+
+    if budget is None:
+        return _decode_image(image_file, info, settings, target, False, cache, decoder)
+    target, reservation, reduced = _reserve_decode(image_file, info, target, budget, ticket)
+    try:
+        prepared = _decode_image(image_file, info, settings, target, reduced, cache, decoder)
+    except BaseException:
+        reservation.release()
+        raise
+    if prepared is None:
+        reservation.release()
+        return None
+    # Multi-frame files keep a frame decoded ahead while one is drawn (see iter_frames)
+    copies = 2 if prepared.frames > 1 else 1
+    reservation.resize(memory_budget.held_bytes(prepared.width, prepared.height) * copies)
+    return prepared._replace(reservation=reservation)
+
+def _reserve_decode(image_file, info, target, budget, ticket):
+    """Reserve the memory decoding image_file takes from budget, first
+    shrinking the target if it couldn't fit even in the whole budget.
+    Returns (target, reservation, whether the target was shrunk)."""
+    draft = image_file.lower().endswith(tuple(PASSTHROUGH_EXTENSIONS))
+    copies = 2 if info.frames > 1 else 1
+    needed = memory_budget.decode_bytes(info.width, info.height, target, draft) * copies
+    smaller = needed > budget.limit and \
+        memory_budget.reduced_target(info.width, info.height, target, budget.limit, draft, copies)
+    if smaller:
+        target = smaller
+        needed = memory_budget.decode_bytes(info.width, info.height, target, draft) * copies
+        print(f"Decoding {image_file} at {target[0]}x{target[1]} to fit the "
+              f"{format_size(budget.limit)} memory budget")
+    elif needed > budget.limit:
+        # No smaller size would fit, so don't spoil the page: decode it as asked, on its own
+        print(f"Decoding {image_file} alone: it needs more than the {format_size(budget.limit)} memory budget")
+        needed = budget.limit
+    return target, budget.reserve(needed, ticket, bool(smaller)), bool(smaller)
+
+def _decode_image(image_file, info, settings, target, reduced, cache, decoder):
+    """The decoding half of prepare_image. A `reduced` target (smaller than
+    the settings ask for) bypasses the cache, which holds full-size results."""
+    lower = image_file.lower()
+    key = None
+    if cache is not None and not reduced and (lower.endswith('.heic') or target):
+        with tracing.span('cache', file=image_file) as trace:
+            key = cache.key(image_cache.file_hash(image_file), _image_settings(settings))
+            cached = cache.get(key)
+            trace['hit'] = bool(cached)
+        if cached:
+            return _prepared_from_cache(*cached)
+
+    with tracing.span('decode', file=image_file, bytes=os.path.getsize(image_file)):
+        if decoder is not None and info.frames == 1:
+            try:
+                image, original_size = decoder.decode(image_file, target, RESAMPLE_FILTERS[settings['resample']])
+            except Exception as e:
+                print(f"Error loading image {image_file}: {e}")
+                return None
+            return _prepare_frame(image, settings, lower.endswith(tuple(LOSSY_EXTENSIONS)), 1, info.orientation,
+                                  cache, key, original_size, target)
         image = load_image(image_file)
-        if image:
-            png_file = os.path.splitext(image_file)[0] + ".png"
-            image.save(png_file)
-            image_files.append(png_file)
-            temp_files.append(png_file)  # Track converted files separately
-            print(f"Converting .heic {image_file} to {png_file}")
-            print("-----------------------\n")
-    else:
-        image_files.append(image_file)
+        if image is None:
+            return None
+        if info.frames > 1:
+            # Multi-frame files keep their handle open for seek(); copy the frame out
+            frame = image.copy()
+            image.close()
+            image = frame
+        return _prepare_frame(image, settings, lower.endswith(tuple(LOSSY_EXTENSIONS)), info.frames,
+                              info.orientation, cache, key, target=target)
 
-def fit_image_to_page(image_path, c, page_width, page_height):
-    """Resize and center image maintaining aspect ratio"""
-    img = Image.open(image_path)
-    img_width, img_height = img.size
-    
-    # Calculate scale factors for width and height
-    width_scale = page_width / img_width
-    height_scale = page_height / img_height
-    
-    # Use the smaller scale factor to ensure the image fits on the page
-    scale = min(width_scale, height_scale)
-    
-    # Calculate new dimensions
-    new_width = img_width * scale
-    new_height = img_height * scale
-    
-    # Calculate position to center the image on page
-    x_pos = (page_width - new_width) / 2
-    y_pos = (page_height - new_height) / 2
-    
-    # Draw the image on the page
-    c.drawImage(image_path, x_pos, y_pos, width=new_width, height=new_height)
+def _prepare_frame(image, settings, lossy, frames=1, orientation=1, cache=None, key=None, original_size=None,
+                   target=None):
+    """Resample the current frame of an open PIL image and wrap it for drawing.
 
-def create_pdf_from_images(folder_path, preserve_originals=False):
-    image_files = []
-    temp_files = []  # Track files created during conversion for cleanup
-    
-    # Collect all image files in the folder
-    all_files = []
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if any(file.lower().endswith(ext) for ext in IMAGE_EXTENSIONS):
-                all_files.append(file_path)
+    If a cache key is given the ready-to-embed result is stored under it:
+    the JPEG bytes for re-encoded photos, a fast PNG otherwise. Pass the
+    size the image has in its file as original_size if it was already
+    resampled (by a DecodePool worker). `target` overrides the size the
+    settings' DPI asks for.
+    """
+    original_width, original_height = original_size or image.size
+
+    buffer = None
+    target = target or (settings['dpi'] and target_pixel_size(original_width, original_height, settings['dpi'],
+                                                              orientation=orientation))
+    if target:
+        if image.size != target:
+            # JPEGs can decode at a reduced scale for free; resample the rest of the way
+            image.draft(None, target)
+            from PIL import Image
+            image = image.resize(target, getattr(Image.Resampling, RESAMPLE_FILTERS[settings['resample']]))
+        if lossy and image.mode in ('RGB', 'L', 'CMYK'):
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=settings['jpeg_quality'])
+            buffer.seek(0)
+
+    if key is not None and (buffer or image.mode != 'CMYK'):
+        if buffer is None:
+            data = io.BytesIO()
+            image.save(data, 'PNG', compress_level=1)
+            data = data.getvalue()
+        else:
+            data = buffer.getvalue()
+        meta = {'width': image.width, 'height': image.height, 'original_width': original_width,
+                'original_height': original_height, 'frames': frames, 'orientation': orientation}
+        cache.put(key, meta, data)
+
+    reader = _image_reader(buffer or image)
+    reader.getRGBData()  # Decode now; reportlab caches the result
+    width, height = reader.getSize()
+    return PreparedImage(reader, width, height, original_width, original_height, frames, orientation)
+
+def _prepared_from_cache(meta, data):
+    reader = _image_reader(io.BytesIO(data))
+    reader.getRGBData()
+    return PreparedImage(reader, meta['width'], meta['height'], meta['original_width'],
+                         meta['original_height'], meta['frames'], meta['orientation'])
+
+def iter_frames(image_file, settings=None, start=1, cache=None, orientation=1, target=None):
+    """Yield (frame index, PreparedImage, decode seconds) for the frames of a multi-frame file.
+
+    The file is opened once and frames are read one at a time with seek().
+    A single helper thread decodes the next frame while the caller draws the
+    current one, so at most two frames are in memory however long the file.
+    Downsampled frames go through the cache like single images do. Every
+    frame is drawn with the file's orientation. `target` overrides the size
+    the settings' DPI asks for (frames resized to it aren't cached).
+    """
+    settings = settings or DEFAULT_SETTINGS
+    content_hash = None
+    if cache is not None and settings['dpi'] and not target:
+        content_hash = image_cache.file_hash(image_file)
+
+    from PIL import Image
+    with Image.open(image_file) as image:
+        frames = getattr(image, 'n_frames', 1)
+
+        def load(index):
+            key = None
+            if content_hash:
+                key = cache.key(content_hash, _image_settings(settings), index)
+                cached = cache.get(key)
+                if cached:
+                    return _prepared_from_cache(*cached)
+            with tracing.span('decode', file=image_file, frame=index):
+                image.seek(index)
+                if key and not target_pixel_size(*image.size, settings['dpi'], orientation=orientation):
+                    key = None  # Nothing to save by caching a full-size frame
+                # Copy the frame out, the next seek() reuses the decoder's buffer
+                return _prepare_frame(image.copy(), settings, False, frames, orientation, cache, key, target=target)
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            future = reader.submit(_timed, load, start) if start < frames else None
+            for index in range(start, frames):
+                prepared, seconds = future.result()
+                if index + 1 < frames:
+                    future = reader.submit(_timed, load, index + 1)
+                yield index, prepared, seconds
+
+def iter_prepared_images(image_files, settings=None, prefetch=PREFETCH_IMAGES, cache=None, decoder=None,
+                         budget=None):
+    """Yield (image_file, frame index, prepared image, decode seconds) for every page, in order.
+
+    Up to `prefetch` files are prepared ahead on worker threads while the
+    caller writes the current page, which bounds how many decoded images
+    are held in memory at once. prefetch=0 prepares them one at a time.
+    The first frame of a file comes from the pool; the rest of a multi-frame
+    file are streamed by iter_frames. prepared is None if a file can't be read.
+    A `decoder` (decode_pool.DecodePool) moves the decoding of single-frame
+    files out to its processes; the prefetch threads then just wait on it.
+    With a memory_budget.MemoryBudget, each file's reservation is released
+    once the caller asks for the page after its last one.
+    """
+    settings = settings or DEFAULT_SETTINGS
+    for image_file, prepared, seconds in _iter_first_frames(image_files, settings, prefetch, cache, decoder,
+                                                            budget):
+        yield image_file, 0, prepared, seconds
+        if prepared is not None and prepared.frames > 1:
+            # Decode the other frames at the first one's size if it was shrunk to fit the budget
+            target = None
+            if prepared.reservation is not None and prepared.width < prepared.original_width:
+                wanted = settings['dpi'] and target_pixel_size(prepared.original_width, prepared.original_height,
+                                                               settings['dpi'], orientation=prepared.orientation)
+                if (prepared.width, prepared.height) != (wanted or (prepared.original_width,
+                                                                     prepared.original_height)):
+                    target = (prepared.width, prepared.height)
+            for index, frame, seconds in iter_frames(image_file, settings, cache=cache,
+                                                     orientation=prepared.orientation, target=target):
+                yield image_file, index, frame, seconds
+        if prepared is not None and prepared.reservation is not None:
+            prepared.reservation.release()
+
+def _timed(func, *args):
+    """Call func(*args) and return (its result, seconds it took)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def _iter_first_frames(image_files, settings, prefetch, cache, decoder, budget):
+    if prefetch <= 0:
+        for image_file in image_files:
+            yield (image_file, *_timed(prepare_image, image_file, settings, cache, decoder, budget))
+        return
+
+    remaining = iter(image_files)
+    pending = deque()
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        def submit(image_file):
+            # Tickets make the budget serve files in page order (see MemoryBudget)
+            ticket = budget.ticket() if budget is not None else None
+            return image_file, executor.submit(_timed, prepare_image, image_file, settings, cache, decoder,
+                                               budget, ticket)
+
+        try:
+            for image_file in remaining:
+                pending.append(submit(image_file))
+                if len(pending) >= prefetch:
+                    break
+            while pending:
+                image_file, future = pending.popleft()
+                next_file = next(remaining, None)
+                if next_file is not None:
+                    pending.append(submit(next_file))
+                yield (image_file, *future.result())
+        finally:
+            # Stopped early (error or generator closed): drop queued work
+            for _, future in pending:
+                future.cancel()
+            if budget is not None:
+                # Decodes still waiting for memory would wait forever now; let
+                # them through so the pool can shut down
+                budget.close()
+
+def fit_image_to_page(image, c, page_width, page_height):
+    """Resize and center image maintaining aspect ratio.
+
+    image is a PreparedImage or a file path. Layout uses the original pixel
+    size, turned upright per the EXIF orientation, so downsampling never
+    changes where the image lands on the page.
+    """
+    if isinstance(image, str):
+        image = prepare_image(image)
+    with tracing.span('layout'):
+        img_width, img_height = image.original_width, image.original_height
+        if image.orientation in image_probe.TRANSPOSED_ORIENTATIONS:
+            img_width, img_height = img_height, img_width
+        
+        # Calculate scale factors for width and height
+        width_scale = page_width / img_width
+        height_scale = page_height / img_height
+        
+        # Use the smaller scale factor to ensure the image fits on the page
+        scale = min(width_scale, height_scale)
+        
+        # Calculate new dimensions
+        new_width = img_width * scale
+        new_height = img_height * scale
+        
+        # Calculate position to center the image on page
+        x_pos = (page_width - new_width) / 2
+        y_pos = (page_height - new_height) / 2
     
-    # Process only files in the current folder, not subfolders
+    # Draw the image on the page (reportlab compresses raw pixel data here)
+    with tracing.span('draw', pixels=image.width * image.height):
+        if image.orientation == 1:
+            c.drawImage(image.source, x_pos, y_pos, width=new_width, height=new_height)
+            return
+
+        # Rotated or mirrored photo: draw into the unit square under a transform
+        # that turns it upright, so JPEGs still don't need to be re-encoded
+        s_u, s_v, s_0, t_u, t_v, t_0 = ORIENTATION_TRANSFORMS[image.orientation]
+        c.saveState()
+        c.transform(new_width * s_u, new_height * t_u, new_width * s_v, new_height * t_v,
+                    x_pos + new_width * s_0, y_pos + new_height * t_0)
+        c.drawImage(image.source, 0, 0, width=1, height=1)
+        c.restoreState()
+
+def sort_entries(entries, order='name'):
+    """Return scan_tree entries in page order (see SORT_ORDERS).
+
+    'captured' probes the file headers (a few in parallel) for the EXIF
+    capture time; the probe results are cached for the layout stage.
+    """
+    if order == 'natural':
+        return sorted(entries, key=lambda e: (image_probe.natural_sort_key(e.name), e.path))
+    if order == 'captured':
+        def captured(entry):
+            try:
+                info = image_probe.probe_image(entry.path, entry.size, entry.mtime)
+            except Exception:
+                return entry.mtime
+            return info.captured if info.captured is not None else entry.mtime
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=PREFETCH_IMAGES) as executor:
+            times = list(executor.map(captured, entries))
+        order_keys = {entry.path: (t, image_probe.natural_sort_key(entry.name)) for entry, t in zip(entries, times)}
+        return sorted(entries, key=lambda e: order_keys[e.path])
+    return sorted(entries, key=lambda e: e.path)
+
+def create_pdf_from_images(folder_path, preserve_originals=False, jobs=1, prefetch=PREFETCH_IMAGES,
+                           cache=None, incremental=False, streaming=False, backend=DEFAULT_BACKEND,
+                           decode_workers=0, memory_budget_mb=None, dedup=True, progress=None, cancel=None,
+                           executor=None, **settings):
+    """Create one PDF per folder for folder_path and all of its subfolders.
+
+    Folders are independent, so with jobs > 1 each folder's PDF is built in
+    a process pool of that many workers (jobs=None uses one per CPU).
+    Within a folder, `prefetch` images are decoded ahead of the page being
+    written (see iter_prepared_images); with decode_workers > 0 (None for
+    one per CPU) the decoding itself runs in a decode_pool.DecodePool of that
+    many processes. That only applies to jobs=1: with a process pool every
+    folder already decodes in a process of its own. memory_budget_mb caps
+    the decoded image data held at once (see memory_budget.MemoryBudget);
+    with jobs > 1 each worker gets an equal share. With dedup=True, exact
+    duplicate files in a folder are decoded and embedded once and share the
+    image on every page that shows them. Keyword settings (dpi, resample,
+    jpeg_quality, max_pages, max_volume_mb, max_output_mb, sort,
+    near_duplicates) override DEFAULT_SETTINGS. Pass
+    an image_cache.ConversionCache as `cache` to reuse decoded and resampled
+    images across runs. With incremental=True, folders whose PDF is already
+    up to date (see folder_is_up_to_date) are skipped. `backend` picks the
+    PDF writer (see PDF_BACKENDS); streaming=True is short for
+    backend='direct', whose memory use doesn't grow with the page count.
+    `progress` is called with the typed events from the progress module
+    (scan finished, folder started, image decoded, page written, folder
+    finished) as the build goes; with jobs > 1 the workers' events are
+    relayed to it in this process.
+    `cancel` is a threading.Event; once it is set the build stops before the
+    next page and raises BuildCancelled. The folder being written keeps its
+    previous PDF, and folders already finished keep their new one.
+    Pass a ProcessPoolExecutor as `executor` to build on an existing pool
+    (e.g. when converting many trees in one process) instead of starting
+    one per call.
+    Returns one result dict per folder (see _folder_result).
+    """
+    settings = make_settings(**settings)
+    if streaming:
+        backend = 'direct'
+    if backend not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF backend: {backend} (choose from {', '.join(PDF_BACKENDS)})")
+    if memory_budget_mb is not None and memory_budget_mb <= 0:
+        raise ValueError("memory_budget_mb must be a positive number")
+    options = {'prefetch': prefetch, 'cache': cache, 'incremental': incremental, 'backend': backend,
+               'memory_budget_mb': memory_budget_mb, 'dedup': dedup}
+    with tracing.span('scan', folder=folder_path) as trace:
+        index = scan_tree(folder_path)
+        trace['images'] = sum(len(entries) for entries in index.values())
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    events.emit(progress, events.ScanFinished, folder_path, sum(1 for entries in index.values() if entries),
+                sum(len(entries) for entries in index.values()),
+                sum(e.size for entries in index.values() for e in entries))
+
+    if jobs <= 1:
+        decoder = None
+        if decode_workers != 0 and any(not e.name.lower().endswith(tuple(PASSTHROUGH_EXTENSIONS))
+                                       for entries in index.values() for e in entries):
+            import decode_pool
+            decoder = decode_pool.DecodePool(decode_workers)
+            # Keep a decode queued for every worker
+            options['prefetch'] = max(prefetch, decoder.workers)
+        results = []
+        with decoder or nullcontext():
+            for folder, entries in index.items():
+                if cancel is not None and cancel.is_set():
+                    raise BuildCancelled(folder, results)
+                try:
+                    results.append(create_folder_pdf(folder, entries, preserve_originals, settings,
+                                                     progress=progress, cancel=cancel, decoder=decoder, **options))
+                except BuildCancelled as e:
+                    raise BuildCancelled(e.folder_path, results) from None
+        return results
+
+    # Folders without images only print a message and up-to-date folders are
+    # skipped; there's no need to ship either of them out to the pool
+    results = {folder: create_folder_pdf(folder, entries, preserve_originals, settings, incremental=incremental,
+                                         backend=backend, progress=progress)
+               for folder, entries in index.items()
+               if not entries or (incremental and folder_is_up_to_date(folder, entries, settings, backend))}
+    pending = {folder: entries for folder, entries in index.items() if folder not in results}
+
+    # Submit the biggest folders first so one large folder doesn't finish last
+    order = sorted(pending, key=lambda f: sum(e.size for e in pending[f]), reverse=True)
+    if order:
+        # Workers can't call back into this process; they post their events
+        # to a managed queue that is drained here while waiting, and watch a
+        # managed copy of the cancel event
+        import multiprocessing
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+        manager = multiprocessing.Manager() if progress is not None or cancel is not None else None
+        queue = manager.Queue() if progress is not None else None
+        worker_cancel = manager.Event() if cancel is not None else None
+        if memory_budget_mb:
+            # Every worker decodes its own folder; split the budget between them
+            options['memory_budget_mb'] = memory_budget_mb / jobs
+        try:
+            pool = nullcontext(executor) if executor is not None else \
+                ProcessPoolExecutor(max_workers=min(jobs, len(order)))
+            with pool as executor:
+                profile = tracing.active() is not None
+                futures = {executor.submit(_build_folder_job, folder, pending[folder], preserve_originals,
+                                           settings, options, queue, worker_cancel, profile)
+                           for folder in order}
+                while futures:
+                    done, futures = wait(futures, timeout=0.1, return_when=FIRST_COMPLETED)
+                    _relay_events(queue, progress)
+                    if cancel is not None and cancel.is_set() and not worker_cancel.is_set():
+                        worker_cancel.set()
+                        for future in futures:
+                            future.cancel()
+                    for future in done:
+                        if future.cancelled():
+                            continue
+                        result = future.result()
+                        if result is None:
+                            continue  # Cancelled mid-folder
+                        trace_events = result.pop('trace_events', None)
+                        if trace_events and tracing.active() is not None:
+                            tracing.active().add_events(trace_events)
+                        if result['error']:
+                            print(f"Error creating PDF for {result['folder']}: {result['error']}")
+                        results[result['folder']] = result
+        finally:
+            if manager is not None:
+                manager.shutdown()
+    if cancel is not None and cancel.is_set():
+        raise BuildCancelled(results=[results[folder] for folder in index if folder in results])
+    return [results[folder] for folder in index]
+
+def _relay_events(queue, progress):
+    """Pass the events worker processes have queued so far to progress"""
+    while queue is not None:
+        try:
+            event = queue.get_nowait()
+        except Exception:  # queue.Empty, re-raised through the manager
+            return
+        progress(event)
+
+def _folder_result(folder_path, pdf_files=(), error=None, **stats):
+    """Result of one folder build: the PDF(s) written, an error message if
+    it failed, whether it was skipped as up to date, and the counters
+    collected by create_folder_pdf. pdf_file is the first (usually only)
+    volume, or None if nothing was written; failed_images lists the files
+    that couldn't be read and so have no page."""
+    result = {'folder': folder_path, 'pdf_file': pdf_files[0] if pdf_files else None,
+              'pdf_files': list(pdf_files), 'error': error, 'skipped': False,
+              'pages': 0, 'downsampled': 0, 'source_bytes': 0, 'pdf_bytes': 0,
+              'pixels_in': 0, 'pixels_out': 0, 'seconds': 0.0, 'cache_hits': 0, 'cache_misses': 0,
+              'memory_peak_bytes': 0, 'memory_waits': 0, 'memory_wait_seconds': 0.0, 'reduced_scale': 0,
+              'size_report': None, 'duplicates': 0, 'near_duplicates': 0, 'duplicate_bytes': 0,
+              'duplicate_seconds': 0.0, 'hash_seconds': 0.0, 'heic_skipped': 0, 'failed_images': []}
+    result.update(stats)
+    return result
+
+def folder_failed(result):
+    """Whether a folder build failed outright or left unreadable images out"""
+    return bool(result['error'] or result['failed_images'])
+
+def _build_folder_job(folder_path, entries, preserve_originals, settings, options, queue=None, cancel=None,
+                      profile=False):
+    """Process pool entry point: build one folder and report back instead of raising.
+
+    Progress events go to queue (a managed queue) when one is given. With
+    profile=True the worker's trace events come back in the result under
+    'trace_events' for the parent's profiler.
+    Returns None if the build was cancelled.
+    """
+    progress = queue.put if queue is not None else None
+    profiler = tracing.enable() if profile else None
+    try:
+        result = create_folder_pdf(folder_path, entries, preserve_originals, settings, progress=progress,
+                                   cancel=cancel, **options)
+    except BuildCancelled:
+        return None
+    except Exception as e:
+        result = _folder_result(folder_path, error=f"{type(e).__name__}: {e}")
+        events.emit(progress, events.FolderFinished, folder_path, result)
+    finally:
+        if profiler is not None:
+            tracing.disable()
+    if profiler is not None:
+        result['trace_events'] = profiler.events
+    return result
+
+def create_folder_pdf(folder_path, entries, preserve_originals=False, settings=None,
+                      prefetch=PREFETCH_IMAGES, cache=None, incremental=False, backend=DEFAULT_BACKEND,
+                      memory_budget_mb=None, dedup=True, progress=None, cancel=None, decoder=None):
+    """Build the PDF for a single folder from its scan_tree entries.
+
+    In incremental mode the folder is skipped when its manifest shows the PDF
+    was built from exactly these inputs and settings, and a new manifest is
+    written after every build.
+    Folders with images report FolderStarted, ImageDecoded, PageWritten and
+    FolderFinished events to `progress`. A set `cancel` event stops the
+    build before the next page with BuildCancelled (see write_volumes).
+    `decoder` is an optional decode_pool.DecodePool (see prepare_image).
+    With memory_budget_mb, decoding for the folder stays within a
+    memory_budget.MemoryBudget of that size. dedup and
+    settings['near_duplicates'] are create_pdf_from_images'.
+    Returns a result dict (see _folder_result); its pdf_file is None if the
+    folder had no images.
+    """
+    if not entries:
+        progress = None  # Nothing to report for folders without images
+    events.emit(progress, events.FolderStarted, folder_path, len(entries), sum(e.size for e in entries))
+    with tracing.span('folder', folder=folder_path) as trace:
+        result = _build_folder(folder_path, entries, preserve_originals, settings, prefetch, cache,
+                               incremental, backend, progress, cancel, decoder, memory_budget_mb, dedup)
+        trace.update(pages=result['pages'], bytes=result['pdf_bytes'], skipped=result['skipped'])
+    events.emit(progress, events.FolderFinished, folder_path, result)
+    return result
+
+def _build_folder(folder_path, entries, preserve_originals, settings, prefetch, cache, incremental,
+                  backend, progress, cancel, decoder=None, memory_budget_mb=None, dedup=True):
+    settings = settings or DEFAULT_SETTINGS
+    start = time.perf_counter()
+
+    if incremental and entries and folder_is_up_to_date(folder_path, entries, settings, backend):
+        print(f"PDF is up to date, skipping folder: {folder_path}")
+        pdf_files = [os.path.join(folder_path, name) for name, _, _ in read_manifest(folder_path)['pdfs']]
+        return _folder_result(folder_path, pdf_files, skipped=True)
+
     print(f"Processing images in folder: {folder_path}")
-    current_folder_files = [f for f in all_files if os.path.dirname(f) == folder_path]
-    
-    # Use tqdm for progress bar
-    for file_path in tqdm(current_folder_files, desc="Processing images"):
-        if any(file_path.lower().endswith(ext) for ext in IMAGE_EXTENSIONS):
-            convert_to_png(file_path, image_files, temp_files)
-    
-    # Process subfolders recursively
-    for item in os.listdir(folder_path):
-        subfolder_path = os.path.join(folder_path, item)
-        if os.path.isdir(subfolder_path):
-            create_pdf_from_images(subfolder_path, preserve_originals)
+
+    usable = []
+    heic_skipped = 0
+    for entry in entries:
+        # Check if HEIC support is available
+        if entry.name.lower().endswith('.heic') and not heic_support():
+            print(f"Skipping HEIC file (no support): {entry.path}")
+            heic_skipped += 1
+            continue
+        usable.append(entry)
+    ordered = sort_entries(usable, settings['sort'])
+    image_files = [entry.path for entry in ordered]
+    source_bytes = sum(entry.size for entry in usable)
 
     if not image_files:
         print(f"No image files found in {folder_path}")
-        return
+        return _folder_result(folder_path, heic_skipped=heic_skipped)
+
+    stats = {'pages': 0, 'downsampled': 0, 'pixels_in': 0, 'pixels_out': 0, 'heic_skipped': heic_skipped,
+             'duplicates': 0, 'near_duplicates': 0, 'duplicate_bytes': 0, 'duplicate_seconds': 0.0,
+             'hash_seconds': 0.0}
+    cache_before = cache.stats() if cache is not None else None
+    sizes = {entry.path: entry.size for entry in usable}
+
+    found = duplicates.Duplicates({}, {}, 0.0)
+    if dedup or settings['near_duplicates'] is not None:
+        with tracing.span('hash', folder=folder_path):
+            found = duplicates.find_duplicates(ordered, dedup, settings['near_duplicates'])
+        for image_file, like in found.near.items():
+            print(f"Skipping near-duplicate: {image_file} (looks like {os.path.basename(like)})")
+        image_files = [image_file for image_file in image_files if image_file not in found.near]
+        stats.update(near_duplicates=len(found.near), hash_seconds=found.seconds,
+                     duplicate_bytes=sum(sizes[image_file] for image_file in found.near))
+    # Copies skip decoding when their original's pages can be reused without its pixels: the direct
+    # writer draws them by key into the one PDF holding the original, and fitted pages are small JPEGs.
+    # Otherwise they are decoded again and only share the embedded image.
+    decoded_copies = not settings['max_output_mb'] and \
+        (backend != 'direct' or bool(settings['max_pages'] or settings['max_volume_mb']))
+    unique_files = [image_file for image_file in image_files
+                    if decoded_copies or image_file not in found.exact]
+
+    budget = memory_budget.MemoryBudget(memory_budget_mb) if memory_budget_mb else None
+    report = []
+    if settings['max_output_mb']:
+        decoded = iter_fitted_images(folder_path, unique_files, settings, cancel=cancel, report=report,
+                                     extra_pages=len(found.exact), budget=budget)
+    else:
+        decoded = iter_prepared_images(unique_files, settings, prefetch, cache, decoder, budget)
+    if found.exact:
+        decoded = iter_shared_duplicates(decoded, image_files, found.exact, stats, decoded_copies)
+    prepared = _report_decoded(folder_path, decoded, sizes, progress)
+    written = set()
+    embedded = set()
+    pdf_files = write_volumes(folder_path, prepared, settings, backend, stats, progress, cancel, written,
+                              embedded)
+    # A copy counts as shared only if every page of it reused an image already in the same PDF
+    shared = [image_file for image_file in found.exact if image_file in written and image_file not in embedded]
+    stats['duplicates'] = len(shared)
+    stats['duplicate_bytes'] += sum(sizes[image_file] for image_file in shared)
+    # Unreadable files, and copies of them, never made it onto a page
+    failed_images = [image_file for image_file in image_files if image_file not in written]
+    if budget is not None:
+        budget_stats = budget.stats()
+        stats.update(memory_peak_bytes=budget_stats['peak_bytes'], memory_waits=budget_stats['waits'],
+                     memory_wait_seconds=budget_stats['wait_seconds'], reduced_scale=budget_stats['reduced'])
+
+    if not pdf_files:
+        print(f"No readable images in {folder_path}")
+        return _folder_result(folder_path, seconds=time.perf_counter() - start, heic_skipped=heic_skipped,
+                              failed_images=failed_images)
+    stats['failed_images'] = failed_images
 
-    folder_name = os.path.basename(folder_path)
-    pdf_file = os.path.join(folder_path, f'{folder_name}.pdf')
-    c = canvas.Canvas(pdf_file, pagesize=letter)
-    page_width, page_height = letter
-    
-    image_files.sort()
-    for image_file in tqdm(image_files, desc="Creating PDF"):
-        # Draw images onto PDF with proper sizing
-        fit_image_to_page(image_file, c, page_width, page_height)
-        c.showPage()
-    c.save()
     print('*****************************************')
-    print('Finished creating:', pdf_file.replace(folder_path + '/', ''))
+    for pdf_file in pdf_files:
+        print('Finished creating:', pdf_file.replace(folder_path + '/', ''))
+    if failed_images:
+        print(f"Left out {len(failed_images)} unreadable image{'s' if len(failed_images) != 1 else ''}"
+              f"{' (kept)' if not preserve_originals else ''}: "
+              f"{', '.join(os.path.basename(image_file) for image_file in failed_images)}")
+    if report:
+        import size_limit
+        print(size_limit.summarize_choices(report, settings['max_output_mb'] * 1024 * 1024))
+        stats['size_report'] = [choice._asdict() for choice in report]
+        pdf_bytes = sum(os.path.getsize(f) for f in pdf_files)
+        if pdf_bytes > settings['max_output_mb'] * 1024 * 1024:
+            smallest = sum(1 for choice in report if choice.scale <= size_limit.MIN_SCALE)
+            how = (f"with {smallest} page{'s' if smallest != 1 else ''} at the smallest scale allowed" if smallest
+                   else "after fitting every page")
+            print(f"Warning: {format_size(pdf_bytes)} is still over the {settings['max_output_mb']:g} MB limit "
+                  f"{how}")
+    if stats['duplicates'] or stats['near_duplicates']:
+        print(summarize_duplicates(stats))
+    if stats['downsampled']:
+        if settings['dpi']:
+            reason = f"to {settings['dpi']} DPI"
+        else:
+            reason = "to fit the size limit" if settings['max_output_mb'] else "to fit the memory budget"
+        print(f"Downsampled {stats['downsampled']} image(s) {reason}: "
+              f"{stats['pixels_in'] / 1e6:.1f} MP -> {stats['pixels_out'] / 1e6:.1f} MP")
     print('*****************************************\n')
 
-    # Delete image files if not preserving originals
+    if cache is not None:
+        cache_after = cache.stats()
+        stats['cache_hits'] = cache_after['hits'] - cache_before['hits']
+        stats['cache_misses'] = cache_after['misses'] - cache_before['misses']
+
+    # With unreadable images left out, or pages shrunk for the memory budget, the folder isn't done;
+    # the next run tries it again
+    if incremental and not failed_images and not stats.get('reduced_scale'):
+        write_manifest(folder_path, entries, settings, pdf_files, backend)
+
+    # Delete original files if not preserving; only files that are on a page go, so skipped
+    # near-duplicates and unreadable images stay
     if not preserve_originals:
-        # Only delete temporary converted files in any case
+        delete_written_images([image_file for image_file in image_files if image_file in written])
+
+    return _folder_result(folder_path, pdf_files, source_bytes=source_bytes,
+                          pdf_bytes=sum(os.path.getsize(f) for f in pdf_files),
+                          seconds=time.perf_counter() - start, **stats)
+
+def iter_fitted_images(folder_path, image_files, settings, workers=None, cancel=None, report=None,
+                       extra_pages=0, budget=None):
+    """Like iter_prepared_images, but with every page encoded so that the
+    folder's PDF stays under settings['max_output_mb'] (see
+    size_limit.fit_pages). All pages are fitted before the first is
+    yielded; each page's size_limit.PageChoice is appended to `report`.
+    extra_pages counts pages added later that reuse these images. With a
+    memory_budget.MemoryBudget, decoding for the fit stays within it.
+    """
+    import size_limit
+    from PIL import Image
+
+    def target_size(info):
+        return settings['dpi'] and target_pixel_size(info.width, info.height, settings['dpi'],
+                                                     orientation=info.orientation)
+
+    start = time.perf_counter()
+    pages = size_limit.list_pages(image_files, target_size, budget)
+    resample = getattr(Image.Resampling, RESAMPLE_FILTERS[settings['resample']])
+    try:
+        fitted = size_limit.fit_pages(pages, int(settings['max_output_mb'] * 1024 * 1024), settings, resample,
+                                      workers, cancel, extra_pages, budget)
+    except InterruptedError:
+        raise BuildCancelled(folder_path) from None
+    seconds = (time.perf_counter() - start) / max(1, len(pages))
+    chosen = defaultdict(list)
+    for page, fit in zip(pages, fitted):
+        chosen[page.file].append((page, fit))
+    for image_file in image_files:
+        if image_file not in chosen:
+            yield image_file, 0, None, 0.0  # list_pages couldn't read it
+            continue
+        for page, (encoded, choice) in chosen[image_file]:
+            if report is not None:
+                report.append(choice)
+            info = page.info
+            yield image_file, page.frame, PreparedImage(encoded, choice.width, choice.height, info.width,
+                                                        info.height, info.frames, info.orientation), seconds
+
+def iter_shared_duplicates(decoded, image_files, exact, stats, decoded_copies=False):
+    """Give the pages of exact duplicates their original's key, in
+    image_files order, so the direct writer embeds the image once per volume.
+
+    With decoded_copies, `decoded` has every file's pages and a copy's are
+    passed on as decoded (one drawn from its JPEG path is pointed at the
+    original's path, so reportlab shares it too). Otherwise `decoded` comes
+    from the files that are not keys of `exact` (see
+    duplicates.find_duplicates) and a copy is neither read nor decoded: it
+    gets its original's pages again. Those are held until the last copy
+    without their decoded pixels (a path or encoded JPEG is kept), so they
+    can only be drawn by key into the PDF that already holds the original.
+    Counts the decode seconds the duplicates saved into stats
+    (write_volumes tells which of them were embedded again).
+    """
+    copies = {}
+    for original in exact.values():
+        copies[original] = copies.get(original, 0) + 1
+    held = {}
+    upcoming = next(decoded, None)
+    try:
+        for image_file in image_files:
+            original = exact.get(image_file)
+            if original is not None and not decoded_copies:
+                pages = held.get(original, [])
+                for frame, image, seconds in pages:
+                    stats['duplicate_seconds'] += seconds
+                    yield image_file, frame, image, 0.0
+                copies[original] -= 1
+                if not copies[original]:
+                    held.pop(original, None)
+                continue
+
+            pages = []
+            while upcoming is not None and upcoming[0] == image_file:
+                _, frame, image, seconds = upcoming
+                if image is not None and original is not None:
+                    source = original if isinstance(image.source, str) else image.source
+                    image = image._replace(source=source, key=f'{original}#{frame}')
+                elif image is not None and image_file in copies:
+                    image = image._replace(key=f'{image_file}#{frame}')
+                    if not decoded_copies:
+                        kept = image.source if isinstance(image.source, (str, pdf_writer.EncodedImage)) else None
+                        pages.append((frame, image._replace(source=kept, reservation=None), seconds))
+                yield image_file, frame, image, seconds
+                upcoming = next(decoded, None)
+            if pages:
+                held[image_file] = pages
+    finally:
+        decoded.close()
+
+def summarize_duplicates(stats):
+    """One line on the duplicates a folder shared or skipped"""
+    parts = []
+    if stats['duplicates']:
+        parts.append(f"shared {stats['duplicates']} exact duplicate{'s' if stats['duplicates'] != 1 else ''}")
+    if stats['near_duplicates']:
+        parts.append(f"skipped {stats['near_duplicates']} near-duplicate"
+                     f"{'s' if stats['near_duplicates'] != 1 else ''}")
+    line = ', '.join(parts).capitalize()
+    return (line + f": {format_size(stats['duplicate_bytes'])} not embedded again, "
+            f"{stats['duplicate_seconds']:.1f} s of decoding saved ({stats['hash_seconds']:.1f} s hashing)")
+
+def _report_decoded(folder_path, prepared, sizes, progress):
+    """Pass iter_prepared_images through as (image_file, frame, image),
+    reporting an ImageDecoded event for each frame"""
+    try:
+        for image_file, frame, image, seconds in prepared:
+            events.emit(progress, events.ImageDecoded, folder_path, image_file, frame,
+                        sizes[image_file] if frame == 0 else 0, seconds, image is not None,
+                        image.original_width * image.original_height if image is not None else 0)
+            yield image_file, frame, image
+    finally:
+        prepared.close()
+
+def write_volumes(folder_path, prepared, settings, backend, stats, progress=None, cancel=None, written=None,
+                  embedded=None):
+    """Draw the pages from iter_prepared_images into the folder's PDF volume(s).
+
+    Without max_pages / max_volume_mb everything goes into <folder>.pdf.
+    Otherwise a new <folder>_partNNN.pdf is started whenever the next page
+    would push the current one past either limit; a folder that fits in a
+    single volume still ends up as <folder>.pdf. Size limits need exact
+    byte counts, so they always use the direct writer, as do pages already
+    encoded for max_output_mb.
+    Volumes are written to hidden temporary files and only moved into place
+    once every page is done, so an error or a cancel (cancel.is_set(),
+    checked before each page) leaves the previous PDFs untouched and no
+    partial file behind.
+    Reports a PageWritten event to `progress` for every page, and adds the
+    file of each page drawn to the `written` set if one is given, and to
+    `embedded` unless its image was already in that volume under its key
+    (see iter_shared_duplicates).
+    Returns the PDF paths written and updates stats in place.
+    """
+    max_pages = settings['max_pages']
+    max_bytes = settings['max_volume_mb'] and settings['max_volume_mb'] * 1024 * 1024
+    split = bool(max_pages or max_bytes)
+    if max_bytes or settings['max_output_mb']:
+        backend = 'direct'  # Pages fitted to max_output_mb are already encoded for it
+    sized = backend == 'direct'  # Only the direct writer knows its size as it goes
+    page_width, page_height = PAGE_SIZE
+
+    temp_files = []
+    c = None
+    volume_pages = 0
+    volume_keys = set()  # Keys of the images the current volume holds
+    try:
+        for image_file, frame, image in prepared:
+            if cancel is not None and cancel.is_set():
+                raise BuildCancelled(folder_path)
+            # Images are decoded ahead on worker threads; draw with proper sizing
+            if image is None:
+                continue
+
+            # An image this volume already holds adds nothing but the page
+            shared = sized and image.key is not None and c is not None and c.has_image(image.key)
+            if max_bytes and not shared:
+                # Encode first so the volume check knows the page's exact size
+                with tracing.span('encode', file=image_file) as trace:
+                    image = image._replace(source=pdf_writer.encode_image(image.source))
+                    trace['bytes'] = len(image.source.data)
+            if c is not None and ((max_pages and volume_pages >= max_pages) or
+                                  (max_bytes and c.projected_size(0 if shared else len(image.source.data)) >
+                                   max_bytes)):
+                _save_pdf(c, temp_files[-1])
+                c = None
+            if c is None:
+                temp_files.append(_temp_pdf_path(folder_path, len(temp_files) + 1))
+                c = _open_pdf(temp_files[-1], backend)
+                volume_pages = 0
+                volume_keys = set()
+            if embedded is not None and (image.key is None or image.key not in volume_keys):
+                embedded.add(image_file)
+            volume_keys.add(image.key)
+            if sized and image.key is not None:
+                # reportlab already shares an XObject between draws of the same source
+                image = image._replace(source=c.share_image(image.key, image.source))
+
+            page_start = c.tell() if sized else 0
+            fit_image_to_page(image, c, page_width, page_height)
+            c.showPage()
+            volume_pages += 1
+            pdf_file = _volume_path(folder_path, len(temp_files)) if split else _folder_pdf_path(folder_path)
+            events.emit(progress, events.PageWritten, folder_path, pdf_file, volume_pages,
+                        c.tell() - page_start if sized else 0)
+            stats['pages'] += 1
+            if written is not None:
+                written.add(image_file)
+            stats['pixels_in'] += image.original_width * image.original_height
+            stats['pixels_out'] += image.width * image.height
+            if (image.width, image.height) != (image.original_width, image.original_height):
+                stats['downsampled'] += 1
+        if c is not None:
+            _save_pdf(c, temp_files[-1])
+            c = None
+    except BaseException:
+        if c is not None and sized:
+            c.abort()
         for temp_file in temp_files:
             if os.path.exists(temp_file):
                 os.remove(temp_file)
-        
-        # Delete original files if not preserving
-        delete_image_files(folder_path)
+        raise
+    finally:
+        prepared.close()
+
+    # A folder that fits in a single volume still ends up as <folder>.pdf
+    if len(temp_files) == 1:
+        pdf_files = [_folder_pdf_path(folder_path)]
+    else:
+        pdf_files = [_volume_path(folder_path, number) for number in range(1, len(temp_files) + 1)]
+    for temp_file, pdf_file in zip(temp_files, pdf_files):
+        os.replace(temp_file, pdf_file)
+    _remove_stale_volumes(folder_path, pdf_files)
+    return pdf_files
+
+def _save_pdf(c, pdf_file):
+    with tracing.span('save', file=pdf_file) as trace:
+        c.save()
+        trace['bytes'] = os.path.getsize(pdf_file)
+
+def _open_pdf(pdf_file, backend):
+    if backend == 'direct':
+        return pdf_writer.PdfStreamWriter(pdf_file, pagesize=PAGE_SIZE)
+    return _reportlab().Canvas(pdf_file, pagesize=PAGE_SIZE)
+
+def _folder_pdf_path(folder_path):
+    """Where a folder's PDF goes: <folder>/<folder name>.pdf"""
+    folder_name = os.path.basename(folder_path)
+    return os.path.join(folder_path, f'{folder_name}.pdf')
+
+def _temp_pdf_path(folder_path, number):
+    """Hidden file volume `number` is written to before it is complete"""
+    folder_name = os.path.basename(folder_path)
+    return os.path.join(folder_path, f'.{folder_name}_part{number:03d}.pdf{TEMP_SUFFIX}')
+
+def _volume_path(folder_path, number):
+    """Path of volume `number` of a split folder PDF: <folder>/<folder name>_part001.pdf"""
+    folder_name = os.path.basename(folder_path)
+    return os.path.join(folder_path, f'{folder_name}_part{number:03d}.pdf')
+
+def _remove_stale_volumes(folder_path, pdf_files):
+    """Delete outputs of an earlier build that this one didn't rewrite"""
+    folder_name = os.path.basename(folder_path)
+    prefix = f'{folder_name}_part'
+    candidates = [_folder_pdf_path(folder_path)]
+    for file in os.listdir(folder_path):
+        if file.startswith(prefix) and file.endswith('.pdf') and file[len(prefix):-4].isdigit():
+            candidates.append(os.path.join(folder_path, file))
+    for path in candidates:
+        if path not in pdf_files and os.path.exists(path):
+            os.remove(path)
+
+def _manifest_data(entries, settings, backend, pdf_files):
+    pdfs = []
+    for pdf_file in pdf_files:
+        pdf_stat = os.stat(pdf_file)
+        pdfs.append([os.path.basename(pdf_file), pdf_stat.st_size, pdf_stat.st_mtime])
+    return {
+        'version': MANIFEST_VERSION,
+        'settings': {**settings, 'backend': backend},
+        'inputs': [[entry.name, entry.size, entry.mtime] for entry in entries],
+        'pdfs': pdfs,
+    }
+
+def read_manifest(folder_path):
+    """Return the folder's manifest dict, or None if it is missing or unreadable"""
+    try:
+        with open(os.path.join(folder_path, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_manifest(folder_path, entries, settings, pdf_files, backend=DEFAULT_BACKEND):
+    """Record the inputs, settings and resulting PDF volume(s) of a folder build"""
+    manifest_path = os.path.join(folder_path, MANIFEST_NAME)
+    temp_path = manifest_path + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(_manifest_data(entries, settings, backend, pdf_files), f)
+        os.replace(temp_path, manifest_path)
+    except OSError as e:
+        print(f"Error writing manifest for {folder_path}: {e}")
+
+def folder_is_up_to_date(folder_path, entries, settings, backend=DEFAULT_BACKEND):
+    """Check whether the folder's PDF was built from these exact inputs and settings.
+
+    Any added, removed or modified image (size or mtime), a settings or
+    backend change, or a PDF volume that was deleted or touched since the build makes it stale.
+    """
+    manifest = read_manifest(folder_path)
+    if manifest is None or manifest.get('version') != MANIFEST_VERSION or not manifest.get('pdfs'):
+        return False
+    try:
+        pdf_files = [os.path.join(folder_path, name) for name, _, _ in manifest['pdfs']]
+        current = _manifest_data(entries, settings, backend, pdf_files)
+    except (OSError, ValueError):
+        return False
+    # Round-trip through JSON so tuples and floats compare like the stored copy
+    return json.loads(json.dumps(current)) == manifest
+
+def format_size(num_bytes):
+    """Human readable byte count, e.g. 12.3 MB"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if num_bytes < 1024 or unit == 'GB':
+            return f"{num_bytes:.0f} {unit}" if unit == 'B' else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+def summarize_results(results, elapsed=None):
+    """One-line summary of a run: PDFs, size saved, downsampling and time"""
+    built = [r for r in results if r['pdf_file'] and not r['skipped']]
+    pdf_count = sum(len(r['pdf_files']) for r in built)
+    source_bytes = sum(r['source_bytes'] for r in built)
+    pdf_bytes = sum(r['pdf_bytes'] for r in built)
+    if elapsed is None:
+        elapsed = sum(r['seconds'] for r in results)
+
+    summary = (f"Created {pdf_count} PDF{'s' if pdf_count != 1 else ''} "
+               f"({format_size(pdf_bytes)} from {format_size(source_bytes)} of images")
+    if source_bytes > pdf_bytes:
+        saved = source_bytes - pdf_bytes
+        summary += f", {format_size(saved)} / {saved / source_bytes:.0%} smaller"
+    summary += f") in {elapsed:.1f} s"
+
+    downsampled = sum(r['downsampled'] for r in built)
+    if downsampled:
+        pixels_in = sum(r['pixels_in'] for r in built)
+        pixels_out = sum(r['pixels_out'] for r in built)
+        summary += (f"; downsampled {downsampled} image{'s' if downsampled != 1 else ''} "
+                    f"({pixels_in / 1e6:.1f} -> {pixels_out / 1e6:.1f} megapixels)")
+
+    shared = sum(r['duplicates'] for r in built)
+    near = sum(r['near_duplicates'] for r in built)
+    if shared or near:
+        summary += (f"; {shared} duplicate{'s' if shared != 1 else ''} shared, {near} skipped "
+                    f"({format_size(sum(r['duplicate_bytes'] for r in built))}, "
+                    f"{sum(r['duplicate_seconds'] for r in built):.1f} s of decoding saved)")
+
+    unreadable = sum(len(r['failed_images']) for r in results)
+    if unreadable:
+        summary += f"; {unreadable} unreadable image{'s' if unreadable != 1 else ''} left out"
+
+    skipped = sum(r['skipped'] for r in results)
+    if skipped:
+        summary += f"; skipped {skipped} up-to-date folder{'s' if skipped != 1 else ''}"
+
+    peak = max((r['memory_peak_bytes'] for r in results), default=0)
+    if peak:
+        summary += f"; peak decoded memory {format_size(peak)}"
+        waits = sum(r['memory_waits'] for r in results)
+        if waits:
+            summary += (f", {waits} wait{'s' if waits != 1 else ''} for memory "
+                        f"({sum(r['memory_wait_seconds'] for r in results):.1f} s)")
+        reduced = sum(r['reduced_scale'] for r in results)
+        if reduced:
+            summary += f", {reduced} image{'s' if reduced != 1 else ''} decoded at reduced scale"
+
+    hits = sum(r['cache_hits'] for r in results)
+    misses = sum(r['cache_misses'] for r in results)
+    if hits or misses:
+        summary += f"; cache: {hits} hit{'s' if hits != 1 else ''}, {misses} miss{'es' if misses != 1 else ''}"
+    return summary
 
 def delete_image_files(folder_path):
     try:
         for file in os.listdir(folder_path):
             file_path = os.path.join(folder_path, file)
-            if os.path.isfile(file_path) and any(file.lower().endswith(ext) for ext in IMAGE_EXTENSIONS):
+            if os.path.isfile(file_path) and is_image_file(file):
+                os.remove(file_path)
+        print('*****************************************')        
+        print("Image files deleted.")
+        print('*****************************************\n')
+    except Exception as e:
+        print(f"Error deleting image files:", e)
+
+def delete_written_images(image_files):
+    """Delete the given originals, once their pages are safely in a PDF
+    (unlike delete_image_files, which empties a whole folder of images)"""
+    try:
+        for file_path in image_files:
+            if os.path.isfile(file_path):
                 os.remove(file_path)
         print('*****************************************')        
         print("Image files deleted.")
@@ -213,7 +1398,246 @@ def print_completion_message(folder_name):
     print(completion)
 
 
+# Exit codes of the command line tool
+EXIT_OK = 0
+EXIT_FAILED = 1       # a root was missing, a folder failed to build or had unreadable images
+EXIT_USAGE = 2        # bad arguments (argparse's own code)
+EXIT_INTERRUPTED = 130
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert the images in a folder tree to one PDF per folder. "
+                    "Without roots or --manifest, asks for a folder interactively.")
+    parser.add_argument('roots', nargs='*', metavar='ROOT', help="folder trees to convert")
+    parser.add_argument('--manifest', metavar='FILE',
+                        help="file listing more roots, one per line ('-' reads stdin; # starts a comment)")
+    parser.add_argument('--delete', action='store_true',
+                        help="delete the original images after their PDF is written (batch mode keeps them by default)")
+    parser.add_argument('--summary', metavar='FILE',
+                        help="write a JSON summary of the batch to FILE ('-' for stdout)")
+    parser.add_argument('--metrics', metavar='FILE', action='append',
+                        help="write run metrics to FILE: a Prometheus textfile if it ends in .prom, JSON "
+                             "otherwise (can be given twice for both)")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and rebuild the PDFs of folders whose images change")
+    parser.add_argument('--settle', type=float, default=2.0, metavar='SECONDS',
+                        help="with --watch, wait until a folder has had no changes for this long")
+    parser.add_argument('-q', '--quiet', action='store_true', help="no progress bar")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of folders to build in parallel (0 = one per CPU)")
+    parser.add_argument('--prefetch', type=int, default=PREFETCH_IMAGES,
+                        help="images decoded ahead of the page being written (0 = off)")
+    parser.add_argument('--decode-workers', type=int, default=0,
+                        help="decode HEIC, PNG and other non-JPEG images in this many processes "
+                             "(0 = on the prefetch threads; only with --jobs 1)")
+    parser.add_argument('--memory-budget', type=float, metavar='MB',
+                        help="cap the memory held by decoded images; decoding waits for room, and images too "
+                             "big for the whole budget are decoded at a reduced size, or alone if that can't "
+                             "make them fit")
+    parser.add_argument('--dpi', type=int, default=DEFAULT_SETTINGS['dpi'],
+                        help="downsample images to this resolution on the page, e.g. 150, 200 or 300")
+    parser.add_argument('--resample', choices=list(RESAMPLE_FILTERS), default=DEFAULT_SETTINGS['resample'],
+                        help="filter used when downsampling")
+    parser.add_argument('--jpeg-quality', type=int, default=DEFAULT_SETTINGS['jpeg_quality'],
+                        help="JPEG quality for downsampled photos (1-95)")
+    parser.add_argument('--sort', choices=SORT_ORDERS, default=DEFAULT_SETTINGS['sort'],
+                        help="page order: file name, natural (img2 before img10) or EXIF capture time")
+    parser.add_argument('--max-pages', type=int, default=DEFAULT_SETTINGS['max_pages'],
+                        help="split each folder's PDF into volumes of at most this many pages")
+    parser.add_argument('--max-volume-mb', type=float, default=DEFAULT_SETTINGS['max_volume_mb'],
+                        help="split each folder's PDF into volumes of at most this many MB")
+    parser.add_argument('--backend', choices=PDF_BACKENDS, default=DEFAULT_BACKEND,
+                        help="PDF writer: reportlab, or direct (copies JPEGs in as-is, writes each page "
+                             "straight to disk)")
+    parser.add_argument('--max-output-mb', type=float, default=DEFAULT_SETTINGS['max_output_mb'],
+                        help="keep each folder's PDF under this many MB by choosing JPEG quality and scale per page")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="decode and embed exact duplicate images once per copy instead of sharing them")
+    parser.add_argument('--skip-near-duplicates', type=int, nargs='?', const=duplicates.DEFAULT_NEAR_DISTANCE,
+                        default=DEFAULT_SETTINGS['near_duplicates'], metavar='BITS',
+                        help="leave out images that look like an earlier page (dHash within BITS, default "
+                             f"{duplicates.DEFAULT_NEAR_DISTANCE}); can drop distinct pages that look alike "
+                             "as thumbnails, such as text scans")
+    parser.add_argument('--streaming', action='store_true',
+                        help="same as --backend direct: constant memory for very large folders")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"skip folders whose PDF is up to date (tracked in {MANIFEST_NAME} per folder)")
+    parser.add_argument('--profile', metavar='TRACE_FILE',
+                        help="time each stage and write a Chrome trace (chrome://tracing, ui.perfetto.dev) "
+                             "to TRACE_FILE, then print a per-stage summary")
+    parser.add_argument('--cache', action='store_true',
+                        help=f"reuse decoded/resampled images between runs (stored in {image_cache.DEFAULT_CACHE_DIR})")
+    parser.add_argument('--cache-dir', help="cache location (implies --cache)")
+    parser.add_argument('--cache-size', type=float, default=image_cache.DEFAULT_MAX_MB,
+                        help="maximum cache size in MB; least recently used entries are evicted")
+    args = parser.parse_args(argv)
+    if args.watch and not (args.roots or args.manifest):
+        parser.error("--watch needs at least one ROOT or --manifest")
+    if args.watch and args.delete:
+        parser.error("--watch keeps the original images; --delete can't be combined with it")
+    if not (args.roots or args.manifest):
+        # The interactive prompt asks about originals and has no batch summary to write
+        batch_only = [flag for flag, given in (('--metrics', args.metrics), ('--summary', args.summary),
+                                               ('--quiet', args.quiet), ('--delete', args.delete)) if given]
+        if batch_only:
+            parser.error(f"{', '.join(batch_only)} only apply to batch mode; give a ROOT or --manifest")
+    if args.watch and args.metrics:
+        parser.error("--metrics describes a batch run; it can't be combined with --watch")
+    return args
+
+def build_options(args):
+    """create_pdf_from_images keyword arguments for parsed command line args"""
+    cache = None
+    if args.cache or args.cache_dir:
+        cache = image_cache.ConversionCache(args.cache_dir or image_cache.DEFAULT_CACHE_DIR, args.cache_size)
+    return {'jobs': args.jobs or os.cpu_count() or 1, 'prefetch': args.prefetch,
+            'decode_workers': args.decode_workers, 'memory_budget_mb': args.memory_budget,
+            'dedup': not args.no_dedup, 'cache': cache,
+            'incremental': args.incremental, 'backend': 'direct' if args.streaming else args.backend,
+            'dpi': args.dpi, 'resample': args.resample, 'jpeg_quality': args.jpeg_quality,
+            'max_pages': args.max_pages, 'max_volume_mb': args.max_volume_mb,
+            'max_output_mb': args.max_output_mb, 'sort': args.sort,
+            'near_duplicates': args.skip_near_duplicates}
+
+def read_root_list(manifest):
+    """Roots listed in a manifest file (or stdin for '-'): one per line,
+    blank lines and # comments ignored"""
+    if manifest == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(manifest, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    roots = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            roots.append(line.strip('\'"'))
+    return roots
+
+def run_batch(roots, args):
+    """Convert every root in one process without prompting; returns the exit code.
+
+    The conversion cache and (with --jobs) the process pool are shared by
+    all roots. shi's messages go to stderr so a --summary on stdout stays
+    clean JSON.
+    """
+    options = build_options(args)
+    profiler = tracing.enable() if args.profile else None
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(max_workers=options['jobs']) if options['jobs'] > 1 else None
+    summary = {'roots': [], 'exit_code': EXIT_OK}
+    collector = None
+    if args.metrics:
+        import metrics
+        collector = metrics.RunMetrics()
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(sys.stderr):
+            for root in roots:
+                summary['roots'].append(_run_root(root, args, options, executor, collector))
+    except KeyboardInterrupt:
+        summary['exit_code'] = EXIT_INTERRUPTED
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if profiler is not None:
+            tracing.disable()
+
+    elapsed = time.perf_counter() - start
+    results = [r for entry in summary['roots'] for r in entry['results']]
+    if summary['exit_code'] == EXIT_OK and any(entry['error'] or entry['failed'] for entry in summary['roots']):
+        summary['exit_code'] = EXIT_FAILED
+    summary['totals'] = {
+        'roots': len(summary['roots']), 'folders': len(results),
+        'pdfs': sum(len(r['pdf_files']) for r in results if not r['skipped']),
+        'pages': sum(r['pages'] for r in results),
+        'skipped': sum(r['skipped'] for r in results),
+        'failed': sum(entry['failed'] for entry in summary['roots']),
+        'failed_images': sum(len(r['failed_images']) for r in results),
+        'source_bytes': sum(r['source_bytes'] for r in results),
+        'pdf_bytes': sum(r['pdf_bytes'] for r in results if not r['skipped']),
+        'seconds': elapsed,
+    }
+
+    print(summarize_results(results, elapsed), file=sys.stderr)
+    if collector is not None:
+        collector.root_failures = sum(1 for entry in summary['roots'] if entry['error'])
+        collector.finish()
+        for metrics_file in args.metrics:
+            try:
+                collector.write(metrics_file)
+            except OSError as e:
+                print(f"Error writing metrics to {metrics_file}: {e}", file=sys.stderr)
+                summary['exit_code'] = summary['exit_code'] or EXIT_FAILED
+    if profiler is not None:
+        profiler.write_trace(args.profile)
+        print(profiler.format_summary(), file=sys.stderr)
+    if args.summary == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    elif args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary['exit_code']
+
+def run_watch(roots, args):
+    """Watch roots and rebuild changed folders until interrupted; returns the exit code"""
+    missing = [root for root in roots if not os.path.isdir(root)]
+    if missing:
+        for root in missing:
+            print(f"Invalid path to the parent folder: '{root}'", file=sys.stderr)
+        return EXIT_FAILED
+    try:
+        import watch
+    except ImportError:
+        print("Watch mode needs the watchdog package: pip install watchdog", file=sys.stderr)
+        return EXIT_FAILED
+    watcher = watch.Watcher(roots, settle=args.settle, **build_options(args))
+    watcher.run()
+    print(summarize_results(watcher.results))
+    return EXIT_FAILED if any(folder_failed(r) for r in watcher.results) else EXIT_OK
+
+def _run_root(root, args, options, executor, collector=None):
+    """Convert one root of a batch and describe the outcome. Progress
+    events go to `collector` (a metrics.RunMetrics) too, if given."""
+    entry = {'root': root, 'error': None, 'failed': 0, 'results': [], 'seconds': 0.0}
+    if not os.path.isdir(root):
+        entry['error'] = "not a folder"
+        print(f"Invalid path to the parent folder: '{root}'")
+        return entry
+
+    console = events.ConsoleProgress() if not args.quiet else None
+    progress = console
+    if collector is not None:
+        collector.on_event = console
+        progress = collector
+    start = time.perf_counter()
+    try:
+        entry['results'] = create_pdf_from_images(root, preserve_originals=not args.delete, progress=progress,
+                                                  executor=executor, **options)
+    except Exception as e:
+        # One bad root shouldn't end the batch (Ctrl+C still does)
+        entry['error'] = f"{type(e).__name__}: {e}"
+        print(f"Error converting {root}: {entry['error']}")
+    finally:
+        if console is not None:
+            console.close()
+    entry['seconds'] = time.perf_counter() - start
+    entry['failed'] = sum(1 for r in entry['results'] if folder_failed(r))
+    return entry
+
 def main():
+    args = parse_args()
+    if args.roots or args.manifest:
+        roots = list(args.roots)
+        if args.manifest:
+            try:
+                roots += read_root_list(args.manifest)
+            except OSError as e:
+                print(f"Cannot read manifest {args.manifest}: {e}", file=sys.stderr)
+                sys.exit(EXIT_USAGE)
+        sys.exit(run_watch(roots, args) if args.watch else run_batch(roots, args))
+
     print_welcome_message()
     
     parent_folder = input("Enter the path to the parent folder: ")
@@ -228,8 +1652,22 @@ def main():
         return
     
     preserve = input("Do you want to preserve original images? (y/n): ").lower().startswith('y')
-    
-    create_pdf_from_images(parent_folder, preserve_originals=preserve)
+
+    start = time.perf_counter()
+    profiler = tracing.enable() if args.profile else None
+    console = events.ConsoleProgress()
+    try:
+        results = create_pdf_from_images(parent_folder, preserve_originals=preserve, progress=console,
+                                         **build_options(args))
+    finally:
+        console.close()
+        if profiler is not None:
+            tracing.disable()
+    print(summarize_results(results, time.perf_counter() - start))
+    if profiler is not None:
+        profiler.write_trace(args.profile)
+        print(profiler.format_summary())
+        print(f"Trace written to {args.profile}")
     print_completion_message(parent_folder)
 
 if __name__ == "__main__":
@@ -0,0 +1,264 @@
+# Author: Shady Rashwan
+# Fit a folder's PDF under a size limit by choosing JPEG quality and scale per page
+
+import io
+import math
+import os
+from collections import namedtuple
+import image_probe
+import memory_budget
+import pdf_writer
+import tracing
+
+# Lowest JPEG quality tried before an image is scaled down instead
+MIN_QUALITY = 40
+
+# Images are never scaled below this fraction of their size
+MIN_SCALE = 0.1
+
+# Layout numbers (page size, position, transform) are measured at this
+# width, wider than any real page's, so the structure is never underestimated
+WIDEST_NUMBER = -99999.9999
+
+# What was chosen for one page: its share of the limit, then the JPEG
+# quality and scale used (quality None means the original JPEG was embedded
+# as is), the embedded pixel size and the bytes the image takes
+PageChoice = namedtuple('PageChoice', ['file', 'frame', 'budget', 'quality', 'scale', 'width', 'height', 'bytes'])
+
+# One page to fit: the file, frame index, size (after any DPI downsampling),
+# the probe's ImageInfo and whether the size was shrunk to fit a memory budget
+Page = namedtuple('Page', ['file', 'frame', 'width', 'height', 'info', 'reduced'], defaults=[False])
+
+def _is_jpeg(path):
+    return path.lower().endswith(('.jpg', '.jpeg'))
+
+def list_pages(image_files, target_size, memory=None):
+    """A Page for every frame of image_files. target_size(info) gives the
+    size a page is embedded at before any fitting (None for full size).
+    With a memory_budget.MemoryBudget as `memory`, a page whose decode
+    wouldn't fit in the whole budget is shrunk until it does, if shrinking
+    can get it there (see memory_budget.reduced_target)."""
+    pages = []
+    for image_file in image_files:
+        try:
+            info = image_probe.probe_image(image_file, count_frames=True)
+        except Exception as e:
+            print(f"Error loading image {image_file}: {e}")
+            continue
+        target = target_size(info)
+        reduced = memory is not None and \
+            memory_budget.decode_bytes(info.width, info.height, target, _is_jpeg(image_file)) > memory.limit and \
+            memory_budget.reduced_target(info.width, info.height, target, memory.limit, _is_jpeg(image_file))
+        if reduced:
+            target = reduced
+            print(f"Decoding {image_file} at {target[0]}x{target[1]} to fit the "
+                  f"{memory.limit / (1024 * 1024):g} MB memory budget")
+        width, height = target or (info.width, info.height)
+        pages.extend(Page(image_file, frame, width, height, info, bool(reduced)) for frame in range(info.frames))
+    return pages
+
+class _ByteCounter:
+    """A write-only file that keeps nothing but its length"""
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def tell(self):
+        return self.size
+
+    def close(self):
+        pass
+
+def structure_size(pages, extra_pages=0, max_image_bytes=0):
+    """Bytes a PDF of these pages takes besides the image data itself.
+
+    Measured by writing the document with empty images: a page object and
+    content stream per page, an image XObject per page (extra_pages more
+    pages only draw one of them again), the page tree, cross-reference table
+    and trailer. Every image is taken as CMYK with a Decode array and a
+    /Length of max_image_bytes' digits, and every page as rotated with the
+    widest layout numbers, so the result is an upper bound.
+    """
+    counter = _ByteCounter()
+    widest = WIDEST_NUMBER
+    writer = pdf_writer.PdfStreamWriter(counter, (widest, widest))
+
+    def draw(image):
+        writer.saveState()
+        writer.transform(widest, widest, widest, widest, widest, widest)
+        writer.drawImage(image, widest, widest, widest, widest)
+        writer.restoreState()
+        writer.showPage()
+
+    ref = None
+    for index, page in enumerate(pages):
+        ref = writer.share_image(index, pdf_writer._jpeg_image(page.width, page.height, 'CMYK', b''))
+        draw(ref)
+    for _ in range(extra_pages if ref is not None else 0):
+        draw(ref)  # The last image has the longest object number
+    writer.save()
+    # The empty images' /Length 0 stands in for the real lengths
+    return counter.size + len(pages) * (len(str(max_image_bytes)) - 1)
+
+def page_budgets(pages, available):
+    """Split `available` bytes between pages in proportion to their pixels"""
+    pixels = [page.width * page.height for page in pages]
+    total = sum(pixels) or 1
+    return [available * count // total for count in pixels]
+
+def encode_jpeg(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+def _best_quality(image, budget, low, high):
+    """Highest quality in [low, high] whose JPEG fits budget, by binary
+    search; returns (quality, data) or None if even `low` doesn't fit"""
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode_jpeg(image, quality)
+        if len(data) <= budget:
+            best = quality, data
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best
+
+def fit_image(image, budget, max_quality, resample):
+    """Encode image as a JPEG of at most budget bytes, as good as possible.
+
+    Keeps the full size and searches the quality between MIN_QUALITY and
+    max_quality first. If even MIN_QUALITY is too big, shrinks the image by
+    the square root of how far over it is (JPEG size grows with the pixel
+    count) and searches again, down to MIN_SCALE. Returns (data, quality,
+    scale, size); at MIN_SCALE the result may still be over budget.
+    """
+    data = encode_jpeg(image, max_quality)
+    if len(data) <= budget:
+        return data, max_quality, 1.0, image.size
+    min_quality = min(MIN_QUALITY, max_quality)
+    smallest = encode_jpeg(image, min_quality)
+    scale = 1.0
+    scaled = image
+    while True:
+        if len(smallest) <= budget:
+            quality, data = _best_quality(scaled, budget, min_quality + 1, max_quality - 1) or (min_quality, smallest)
+            return data, quality, scale, scaled.size
+        if scale <= MIN_SCALE:
+            return smallest, min_quality, scale, scaled.size
+        # Aim a little under so one step usually lands, but shrink by no more than half at a time
+        scale *= min(0.95, max(0.5, math.sqrt(budget / len(smallest)) * 0.95))
+        scale = max(scale, MIN_SCALE)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        scaled = image.resize(size, resample)
+        smallest = encode_jpeg(scaled, min_quality)
+
+def _jpeg_ready(image):
+    """image in a mode JPEG can store: alpha is flattened onto white"""
+    from PIL import Image
+    if image.mode in ('RGB', 'L', 'CMYK'):
+        return image
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+def fit_page(page, budget, settings, resample_filter, memory=None):
+    """Choose the encoding of one page within budget; returns (EncodedImage, PageChoice).
+    With a memory_budget.MemoryBudget as `memory`, the decode waits until
+    its estimated memory is reserved, and gives it back once encoded."""
+    from PIL import Image
+    with tracing.span('encode', file=page.file, frame=page.frame) as trace:
+        full_size = (page.width, page.height) == (page.info.width, page.info.height)
+        if full_size and page.info.frames == 1 and _is_jpeg(page.file) and \
+                os.path.getsize(page.file) <= budget:
+            # The original JPEG fits: embed it untouched
+            encoded = pdf_writer.encode_image(page.file)
+            trace['bytes'] = len(encoded.data)
+            return encoded, PageChoice(page.file, page.frame, budget, None, 1.0, page.width, page.height,
+                                       len(encoded.data))
+
+        reservation = None
+        if memory is not None:
+            target = None if full_size else (page.width, page.height)
+            # A decode over the whole budget takes all of it and runs alone
+            needed = min(memory.limit, memory_budget.decode_bytes(page.info.width, page.info.height, target,
+                                                                  _is_jpeg(page.file)))
+            reservation = memory.reserve(needed, reduced=page.reduced and page.frame == 0)
+        try:
+            with Image.open(page.file) as image:
+                image.seek(page.frame)
+                if not full_size:
+                    image.draft(None, (page.width, page.height))
+                image.load()
+                image = _jpeg_ready(image)
+                if image.size != (page.width, page.height):
+                    image = image.resize((page.width, page.height), resample_filter)
+            data, quality, scale, size = fit_image(image, budget, settings['jpeg_quality'], resample_filter)
+        finally:
+            if reservation is not None:
+                reservation.release()
+        encoded = pdf_writer._jpeg_image(size[0], size[1], image.mode, data)
+        trace.update(bytes=len(data), quality=quality, scale=scale)
+        return encoded, PageChoice(page.file, page.frame, budget, quality, scale, size[0], size[1], len(data))
+
+def fit_pages(pages, limit_bytes, settings, resample_filter, workers=None, cancel=None, extra_pages=0,
+              memory=None):
+    """Encode every page so the whole PDF stays under limit_bytes.
+
+    Each page first gets a share of the limit in proportion to its pixels,
+    and pages are fitted in parallel on `workers` threads (Pillow encodes and
+    resizes without holding the GIL). Bytes left over by pages that came in
+    under their share are then handed to the pages that had to give up
+    quality or size, which are fitted again. Returns [(EncodedImage,
+    PageChoice)] in page order. A set `cancel` event stops the search with
+    InterruptedError. extra_pages are pages that will draw one of these
+    images again; they only need room for their own page objects. The room
+    the PDF's structure takes is measured first (see structure_size).
+    Decoding stays within `memory`, a memory_budget.MemoryBudget, if given
+    (see fit_page).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    available = max(0, limit_bytes - structure_size(pages, extra_pages, limit_bytes))
+
+    def fit(page, budget):
+        if cancel is not None and cancel.is_set():
+            raise InterruptedError("Size fitting cancelled")
+        return fit_page(page, budget, settings, resample_filter, memory)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        fitted = list(executor.map(fit, pages, page_budgets(pages, available)))
+
+        # Give the slack to the pages that were squeezed, and fit those again
+        slack = available - sum(choice.bytes for _, choice in fitted)
+        squeezed = [i for i, (_, choice) in enumerate(fitted)
+                    if choice.quality is not None and (choice.quality < settings['jpeg_quality'] or choice.scale < 1)]
+        if slack > 0 and squeezed:
+            extra = page_budgets([pages[i] for i in squeezed], slack)
+            budgets = [fitted[i][1].budget + more for i, more in zip(squeezed, extra)]
+            # A page shrunk for the memory budget was already counted on its first fit
+            again = [pages[i]._replace(reduced=False) for i in squeezed]
+            for i, refit in zip(squeezed, executor.map(fit, again, budgets)):
+                fitted[i] = refit
+    return fitted
+
+def summarize_choices(choices, limit_bytes):
+    """One line on how a folder was fitted under the limit"""
+    total = sum(choice.bytes for choice in choices)
+    qualities = [choice.quality for choice in choices if choice.quality is not None]
+    line = f"Fitted {len(choices)} page{'s' if len(choices) != 1 else ''} into {total / (1024 * 1024):.1f} MB " \
+           f"of images (limit {limit_bytes / (1024 * 1024):g} MB)"
+    originals = len(choices) - len(qualities)
+    if originals:
+        line += f"; {originals} original JPEG{'s' if originals != 1 else ''} kept"
+    if qualities:
+        line += f"; JPEG quality {min(qualities)}-{max(qualities)}"
+    scaled = sum(1 for choice in choices if choice.scale < 1)
+    if scaled:
+        line += f"; {scaled} page{'s' if scaled != 1 else ''} scaled down"
+    return line
@@ -0,0 +1,142 @@
+# Author: Shady Rashwan
+# Preview thumbnails for the GUI, made on background threads and cached on disk
+
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import image_cache
+import image_probe
+import shi
+
+# Longest side of a thumbnail, in pixels
+THUMBNAIL_SIZE = 256
+THUMBNAIL_QUALITY = 80
+
+# Thumbnails get a cache of their own, so they never evict converted images
+THUMBNAIL_CACHE_DIR = os.path.join(image_cache.DEFAULT_CACHE_DIR, 'thumbnails')
+THUMBNAIL_CACHE_MB = 256
+
+def make_thumbnail(path, size=THUMBNAIL_SIZE):
+    """JPEG bytes of the first frame of path, upright (as its page will show
+    it) and at most size pixels on a side. JPEGs are decoded at reduced
+    scale in draft mode, so only a fraction of their pixels are read."""
+    from PIL import Image
+    if path.lower().endswith('.heic') and not shi.heic_support():
+        raise OSError("HEIC support is not available")
+    info = image_probe.probe_image(path)
+    with Image.open(path) as image:
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size))
+        if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+    turn = image_probe.ORIENTATION_TURNS.get(info.orientation)
+    if turn:
+        image = image.transpose(getattr(Image.Transpose, turn))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+class PreviewJob:
+    """The folders under one path with their images in page order, listed
+    on a background thread the way create_pdf_from_images will find them.
+
+    `folders` is a list of (folder, ImageEntry list) once `done` is set.
+    """
+    def __init__(self, path, sort):
+        self.path = path
+        self.sort = sort
+        self.folders = []
+        self.done = False
+        self.error = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop before sorting the next folder"""
+        self._cancel.set()
+
+    def run(self):
+        try:
+            for folder, entries in shi.scan_tree(self.path).items():
+                if self._cancel.is_set():
+                    break
+                if entries:
+                    self.folders.append((folder, shi.sort_entries(entries, self.sort)))
+        except OSError as e:
+            self.error = str(e)
+        finally:
+            self.done = True
+
+class Thumbnailer:
+    """Makes preview thumbnails on background threads.
+
+    Thumbnails are stored in an image_cache.ConversionCache keyed by a hash
+    of the file's path, size and mtime, so an edited or replaced file gets
+    a new one and a cached one costs a single small read. Nothing is made
+    until it is asked for: get() queues one thumbnail and returns at once,
+    so a folder of thousands of images is only decoded as far as it is
+    looked at.
+    """
+    def __init__(self, cache=None, size=THUMBNAIL_SIZE, max_workers=2):
+        self.cache = cache or image_cache.ConversionCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MB)
+        self.size = size
+        self._pending = {}  # key -> Future of a thumbnail being made
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shi-thumbnail')
+        self._lister = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shi-preview')
+
+    def list_folders(self, path, sort='name'):
+        """Start listing the pages under path and return its PreviewJob"""
+        job = PreviewJob(path, sort)
+        self._lister.submit(job.run)
+        return job
+
+    def key(self, entry):
+        """Cache key of an ImageEntry's thumbnail"""
+        identity = hashlib.sha256(f"{entry.path}:{entry.size}:{entry.mtime}".encode()).hexdigest()
+        return self.cache.key(identity, {'thumbnail': self.size})
+
+    def get(self, entry):
+        """(done, JPEG bytes) of an ImageEntry's thumbnail. While it is being
+        made done is False, and the first call queues it; data is None for
+        files that can't be previewed."""
+        key = self.key(entry)
+        with self._lock:
+            if key in self._failed:
+                return True, None
+            if key in self._pending:
+                return False, None
+        cached = self.cache.get(key)
+        if cached is not None:
+            return True, cached[1]
+        with self._lock:
+            if key in self._pending:
+                return False, None
+            future = self._pending[key] = self._executor.submit(self._make, entry, key)
+        # Outside the lock: a callback added to a finished future runs right away
+        future.add_done_callback(lambda _: self._finish(key))
+        return False, None
+
+    def prefetch(self, entries):
+        """Queue the thumbnails of entries that aren't cached yet"""
+        for entry in entries:
+            self.get(entry)
+
+    def _make(self, entry, key):
+        try:
+            data = make_thumbnail(entry.path, self.size)
+        except Exception:
+            with self._lock:
+                self._failed.add(key)
+            return
+        self.cache.put(key, {'path': entry.path}, data)
+
+    def _finish(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
@@ -0,0 +1,137 @@
+# Author: Shady Rashwan
+# Opt-in per-stage timing for shi runs, written as a Chrome trace
+
+import os
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Stages shi reports, in pipeline order (used to order the summary table)
+STAGES = ['scan', 'folder', 'probe', 'cache', 'decode', 'encode', 'layout', 'draw', 'save']
+
+class Profiler:
+    """Collects timed spans as Chrome trace events ("X" complete events).
+
+    Open the resulting file in chrome://tracing or https://ui.perfetto.dev.
+    Timestamps come from time.perf_counter, which is system-wide on the
+    platforms shi runs on, so events from worker processes line up.
+    """
+    def __init__(self):
+        self.events = []
+        self._threads = set()
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage, **args):
+        """Time the body as one `stage` event; the yielded dict is saved as its args"""
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            self._record(stage, start, end, args)
+
+    def _record(self, stage, start, end, args):
+        pid, tid = os.getpid(), threading.get_ident()
+        event = {'name': stage, 'cat': 'shi', 'ph': 'X', 'pid': pid, 'tid': tid,
+                 'ts': start * 1e6, 'dur': (end - start) * 1e6, 'args': args}
+        with self._lock:
+            if (pid, tid) not in self._threads:
+                self._threads.add((pid, tid))
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                                    'args': {'name': threading.current_thread().name}})
+            self.events.append(event)
+
+    def add_events(self, events):
+        """Merge events recorded by another Profiler (e.g. in a worker process)"""
+        with self._lock:
+            self.events.extend(events)
+
+    def summary(self):
+        """Per-stage totals: {stage: {count, seconds, mean_ms, max_ms, bytes}}"""
+        stages = {}
+        for event in self.events:
+            if event['ph'] != 'X':
+                continue
+            stats = stages.setdefault(event['name'], {'count': 0, 'seconds': 0.0, 'max_ms': 0.0, 'bytes': 0})
+            stats['count'] += 1
+            stats['seconds'] += event['dur'] / 1e6
+            stats['max_ms'] = max(stats['max_ms'], event['dur'] / 1e3)
+            stats['bytes'] += event['args'].get('bytes', 0) or 0
+        for stats in stages.values():
+            stats['mean_ms'] = stats['seconds'] / stats['count'] * 1e3
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        return dict(sorted(stages.items(), key=lambda item: (order.get(item[0], len(order)), item[0])))
+
+    def folder_summary(self):
+        """Per-folder totals from the 'folder' spans: {folder: {seconds, pages, bytes}}"""
+        folders = {}
+        for event in self.events:
+            if event['ph'] == 'X' and event['name'] == 'folder':
+                args = event['args']
+                folders[args.get('folder')] = {'seconds': event['dur'] / 1e6, 'pages': args.get('pages', 0),
+                                               'bytes': args.get('bytes', 0)}
+        return folders
+
+    def format_summary(self):
+        """The per-stage summary as a text table.
+
+        Stages overlap (decoding runs on prefetch threads and folders contain
+        the other stages), so the share column is of the wall time and the
+        rows don't add up to 100%.
+        """
+        wall = time.perf_counter() - self.started
+        lines = [f"{'stage':<8} {'count':>7} {'total s':>9} {'% wall':>7} {'mean ms':>9} {'max ms':>9} {'MB':>9}"]
+        for stage, stats in self.summary().items():
+            lines.append(f"{stage:<8} {stats['count']:>7} {stats['seconds']:>9.3f} "
+                         f"{stats['seconds'] / wall:>7.0%} {stats['mean_ms']:>9.2f} {stats['max_ms']:>9.2f} "
+                         f"{stats['bytes'] / (1024 * 1024):>9.1f}")
+        return '\n'.join(lines)
+
+    def write_trace(self, trace_file):
+        """Write the Chrome trace-event JSON, with the summaries under otherData"""
+        with self._lock:
+            events = list(self.events)
+        data = {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'stages': self.summary(), 'folders': self.folder_summary()}}
+        with open(trace_file, 'w') as f:
+            json.dump(data, f)
+
+# The profiler spans are recorded to, or None when profiling is off
+_active = None
+
+def active():
+    return _active
+
+def enable(profiler=None):
+    """Start recording spans (process-wide) and return the Profiler"""
+    global _active
+    _active = profiler or Profiler()
+    return _active
+
+def disable():
+    global _active
+    _active = None
+
+def span(stage, **args):
+    """Context manager timing one stage when profiling is on; a no-op otherwise.
+
+    Keyword args (file, folder, bytes...) are saved with the event; the body
+    can add more through the yielded dict.
+    """
+    if _active is None:
+        return nullcontext(args)
+    return _active.span(stage, **args)
+
+@contextmanager
+def profiling(trace_file=None):
+    """Profile the body: `with tracing.profiling('trace.json') as profiler: ...`"""
+    profiler = enable()
+    try:
+        yield profiler
+    finally:
+        disable()
+        if trace_file:
+            profiler.write_trace(trace_file)
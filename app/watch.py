@@ -0,0 +1,151 @@
+# Author: Shady Rashwan
+# Watch mode: rebuild the PDFs of folders whose images change
+
+import os
+import threading
+import time
+from watchdog.events import (EVENT_TYPE_CLOSED_NO_WRITE, EVENT_TYPE_CREATED, EVENT_TYPE_MOVED,
+                             EVENT_TYPE_OPENED, FileSystemEventHandler)
+from watchdog.observers import Observer
+import shi
+
+# A folder is rebuilt once it has gone this long without events
+DEFAULT_SETTLE_SECONDS = 2.0
+
+# How often the collected events are looked at, in seconds
+POLL_INTERVAL = 0.5
+
+# Reading a file doesn't change it; the builds themselves read every image
+IGNORED_EVENTS = (EVENT_TYPE_OPENED, EVENT_TYPE_CLOSED_NO_WRITE)
+
+class ChangedFolders(FileSystemEventHandler):
+    """Collects the folders touched by filesystem events, with the time of
+    the latest event in each.
+
+    Only image files count, so the PDFs, temp volumes and manifests shi
+    writes never trigger another build. A directory created or moved in
+    marks its whole tree, since its contents may arrive without events of
+    their own. Every event just updates one dict entry, so a burst of
+    thousands of files still means one rebuild per folder.
+    """
+    def __init__(self):
+        self._pending = {}  # folder -> (monotonic time of last event, whole tree?)
+        self._lock = threading.Lock()
+
+    def mark(self, folder, tree=False):
+        with self._lock:
+            _, was_tree = self._pending.get(folder, (0.0, False))
+            self._pending[folder] = (time.monotonic(), tree or was_tree)
+
+    def on_any_event(self, event):
+        if event.event_type in IGNORED_EVENTS:
+            return
+        paths = [event.src_path]
+        if event.event_type == EVENT_TYPE_MOVED:
+            paths.append(event.dest_path)
+        for path in paths:
+            if event.is_directory:
+                if event.event_type in (EVENT_TYPE_CREATED, EVENT_TYPE_MOVED):
+                    self.mark(path, tree=True)
+            elif shi.is_image_file(path):
+                self.mark(os.path.dirname(path))
+
+    def settled(self, settle):
+        """Remove and return the folders quiet for `settle` seconds as
+        {folder: whole tree?}"""
+        now = time.monotonic()
+        with self._lock:
+            ready = {folder: tree for folder, (last, tree) in self._pending.items() if now - last >= settle}
+            for folder in ready:
+                del self._pending[folder]
+        return ready
+
+class Watcher:
+    """Watches folder trees and rebuilds the PDF of each folder whose images
+    were added, changed, renamed or removed.
+
+    Changes are collected for a folder until it has been quiet for `settle`
+    seconds, and a folder holding an image modified more recently than that
+    waits longer (some writers, e.g. network shares, don't report every
+    write), so a folder is never read while files are still being copied
+    into it. Only the changed folders are rebuilt, one at a time, with
+    create_folder_pdf. Keyword options are create_pdf_from_images' (jobs
+    is ignored; decode_workers starts a DecodePool kept for the whole
+    watch); originals are always kept, as deleting them would itself
+    look like a change.
+    """
+    def __init__(self, roots, settle=DEFAULT_SETTLE_SECONDS, **options):
+        options.pop('jobs', None)
+        self.decode_workers = options.pop('decode_workers', 0)
+        self.decoder = None
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.settle = settle
+        self.settings = shi.make_settings(**{key: options.pop(key) for key in shi.DEFAULT_SETTINGS
+                                             if key in options})
+        self.options = options
+        self.changes = ChangedFolders()
+        self.results = []
+
+    def _folders_to_build(self, ready):
+        """{folder: entries} for the settled folders that still exist"""
+        folders = {}
+        for folder, tree in ready.items():
+            if not os.path.isdir(folder):
+                continue  # Removed (or moved away) since
+            if tree:
+                folders.update((path, entries) for path, entries in shi.scan_tree(folder).items() if entries)
+            elif folder not in folders:
+                try:
+                    folders[folder], _ = shi.list_folder(folder)
+                except OSError as e:
+                    print(f"Error scanning folder {folder}: {e}")
+        return folders
+
+    def process_settled(self):
+        """Rebuild the folders that have settled; returns their result dicts"""
+        ready = self.changes.settled(self.settle)
+        if not ready:
+            return []
+        results = []
+        now = time.time()
+        for folder, entries in self._folders_to_build(ready).items():
+            if any(now - entry.mtime < self.settle for entry in entries):
+                self.changes.mark(folder)  # Still being written to
+                continue
+            if not entries:
+                print(f"No images left in {folder}; keeping its PDF")
+                continue
+            try:
+                result = shi.create_folder_pdf(folder, entries, preserve_originals=True,
+                                               settings=self.settings, decoder=self.decoder, **self.options)
+            except Exception as e:
+                # One bad folder shouldn't end the watch
+                result = shi._folder_result(folder, error=f"{type(e).__name__}: {e}")
+                print(f"Error creating PDF for {folder}: {result['error']}")
+            results.append(result)
+        self.results.extend(results)
+        return results
+
+    def run(self, stop=None):
+        """Watch until `stop` (a threading.Event) is set or Ctrl+C is pressed"""
+        stop = stop or threading.Event()
+        if self.decode_workers != 0:
+            import decode_pool
+            self.decoder = decode_pool.DecodePool(self.decode_workers)
+            self.options['prefetch'] = max(self.options.get('prefetch', shi.PREFETCH_IMAGES), self.decoder.workers)
+        observer = Observer()
+        for root in self.roots:
+            observer.schedule(self.changes, root, recursive=True)
+        observer.start()
+        print(f"Watching {', '.join(self.roots)} (Ctrl+C to stop)")
+        try:
+            while not stop.wait(POLL_INTERVAL):
+                self.process_settled()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            observer.stop()
+            observer.join()
+            if self.decoder is not None:
+                self.decoder.close()
+                self.decoder = None
@@ -0,0 +1,13 @@
+# Performance benchmarks for shi
+#
+# corpus.py builds deterministic synthetic image trees, run.py times shi's
+# stages on them and saves the numbers as JSON. Run from the repository
+# root, e.g.: python -m benchmarks.run --output results.json
+
+import os
+import sys
+
+# shi's modules live in app/ and import each other by bare name
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
@@ -0,0 +1,80 @@
+# Compare shi's PDF backends on the same synthetic corpus
+#
+# For every backend in shi.PDF_BACKENDS, writes each format's images into
+# one PDF (as benchmarks.run does) and times a full build, then prints the
+# write throughput and output size side by side. Decoding is the same for
+# both backends, so the write column is where they differ.
+#
+# Usage: python -m benchmarks.backends [--size 4032x3024] [--dpi 200] [--output backends.json]
+
+import argparse
+import json
+import shutil
+import tempfile
+
+from benchmarks import corpus as corpus_module
+from benchmarks.run import bench_build, bench_format, in_fresh_process
+import shi
+
+
+def compare_backends(root, corpus, settings, jobs=1, backends=tuple(shi.PDF_BACKENDS)):
+    """{backend: {'formats': {format: stats}, 'build': stats}} for each backend"""
+    results = {}
+    for backend in backends:
+        formats = {}
+        work_dir = tempfile.mkdtemp(prefix='shi_bench_')
+        try:
+            for name in corpus['params']['formats']:
+                files = [r for r in corpus['files'] if r['format'] == name]
+                if files:
+                    formats[name] = in_fresh_process(bench_format, root, files, settings, backend, work_dir)
+        finally:
+            shutil.rmtree(work_dir)
+        results[backend] = {'formats': formats, 'build': in_fresh_process(bench_build, root, settings, jobs, backend)}
+    return results
+
+
+def print_comparison(results):
+    base, *others = list(results)
+    for other in others:
+        print(f"{base} vs {other}")
+        print(f"{'format':>6} {'write img/s':>23} {'speedup':>8} {'output MB':>21}")
+        for name, stats in results[base]['formats'].items():
+            before, after = stats, results[other]['formats'][name]
+            rate_before = before['write']['images_per_second']
+            rate_after = after['write']['images_per_second']
+            print(f"{name:>6} {rate_before:>11.1f} {rate_after:>11.1f} {rate_after / rate_before:>7.2f}x "
+                  f"{before['output_bytes'] / (1024 * 1024):>10.1f} {after['output_bytes'] / (1024 * 1024):>10.1f}")
+        before, after = results[base]['build'], results[other]['build']
+        print(f"{'build':>6} {before['images_per_second']:>11.1f} {after['images_per_second']:>11.1f} "
+              f"{after['images_per_second'] / before['images_per_second']:>7.2f}x "
+              f"{before['output_bytes'] / (1024 * 1024):>10.1f} {after['output_bytes'] / (1024 * 1024):>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare shi's PDF backends on a synthetic corpus")
+    corpus_module.add_corpus_arguments(parser)
+    parser.add_argument('--root', help="where to build the corpus; reused across runs (default: a temp dir)")
+    parser.add_argument('--dpi', type=float, default=None)
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="worker processes for the build stage")
+    parser.add_argument('--output', help="save the results as JSON")
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix='shi_corpus_')
+    try:
+        corpus = corpus_module.generate_corpus(root, **corpus_module.corpus_kwargs(args))
+        settings = shi.make_settings(dpi=args.dpi)
+        results = compare_backends(root, corpus, settings, args.jobs)
+    finally:
+        if not args.root:
+            shutil.rmtree(root)
+
+    print_comparison(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'corpus': corpus['params'], 'settings': settings, 'jobs': args.jobs,
+                       'backends': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Benchmark for the folder scan used by create_pdf_from_images
+#
+# Builds synthetic trees of empty image files (the scan never decodes them)
+# and compares the old per-level os.walk recursion with shi.scan_tree.
+#
+# Usage: python benchmarks/bench_scan.py [--depth 4 8 16 32] [--files 20]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+import shi  # noqa: E402
+
+
+def make_tree(root, depth, fanout, files_per_folder):
+    """Create a tree `depth` levels deep with `fanout` extra leaf folders per level"""
+    count = 0
+    current = root
+    for level in range(depth):
+        for leaf in range(fanout):
+            leaf_path = os.path.join(current, f'leaf_{leaf}')
+            os.makedirs(leaf_path)
+            for i in range(files_per_folder):
+                open(os.path.join(leaf_path, f'img_{i:04d}.jpg'), 'wb').close()
+                count += 1
+        for i in range(files_per_folder):
+            open(os.path.join(current, f'img_{i:04d}.jpg'), 'wb').close()
+            count += 1
+        current = os.path.join(current, f'level_{level}')
+        os.makedirs(current)
+    return count
+
+
+def legacy_scan(folder_path, index):
+    """The scan as create_pdf_from_images did it: a full os.walk per level"""
+    all_files = []
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            if shi.is_image_file(file):
+                all_files.append(os.path.join(root, file))
+    index[folder_path] = [f for f in all_files if os.path.dirname(f) == folder_path]
+    for item in os.listdir(folder_path):
+        subfolder_path = os.path.join(folder_path, item)
+        if os.path.isdir(subfolder_path):
+            legacy_scan(subfolder_path, index)
+    return index
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the legacy per-level scan with shi.scan_tree')
+    parser.add_argument('--depth', type=int, nargs='+', default=[4, 8, 16, 32, 64])
+    parser.add_argument('--fanout', type=int, default=2)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'depth':>6} {'images':>8} {'legacy s':>10} {'scan s':>10} {'speedup':>8} {'scan us/img':>12}")
+    for depth in args.depth:
+        root = tempfile.mkdtemp(prefix='shi_scan_')
+        try:
+            count = make_tree(root, depth, args.fanout, args.files)
+            legacy = best_of(lambda: legacy_scan(root, {}), args.repeat)
+            scan = best_of(lambda: shi.scan_tree(root), args.repeat)
+            assert sum(len(v) for v in shi.scan_tree(root).values()) == count
+            print(f"{depth:>6} {count:>8} {legacy:>10.4f} {scan:>10.4f} "
+                  f"{legacy / scan:>7.1f}x {scan / count * 1e6:>12.2f}")
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Deterministic synthetic image trees for the benchmarks
+#
+# The same parameters and seed always give the same files, byte for byte
+# for the lossless formats, so runs on different days or machines read the
+# same input. Image content is a smooth random colour field with a layer of
+# fine noise on top, which compresses roughly like a photo.
+#
+# Usage: python -m benchmarks.corpus ROOT [--folders 4] [--depth 2] [--images 10]
+
+import argparse
+import json
+import os
+import random
+
+from benchmarks import APP_DIR  # noqa: F401 (puts app/ on sys.path)
+from PIL import Image
+
+# Format name -> (file extension, Pillow format)
+FORMATS = {
+    'jpeg': ('.jpg', 'JPEG'),
+    'png': ('.png', 'PNG'),
+    'heic': ('.heic', 'HEIF'),
+    'tiff': ('.tiff', 'TIFF'),
+}
+
+# Written at the corpus root; a corpus with matching parameters is reused
+CORPUS_FILE = 'corpus.json'
+CORPUS_VERSION = 1
+
+
+def heic_available():
+    try:
+        from pillow_heif import register_heif_opener
+    except ImportError:
+        return False
+    register_heif_opener()
+    return True
+
+
+def make_image(rng, width, height, noise=24):
+    """A width x height RGB image drawn from rng"""
+    # Coarse random colours, upscaled smoothly, for large-scale structure
+    coarse = Image.frombytes('RGB', (16, 12), rng.randbytes(16 * 12 * 3))
+    image = coarse.resize((width, height), Image.BICUBIC)
+    if noise:
+        # Fine grain so the encoders have real detail to deal with
+        grain = Image.frombytes('L', (width, height), rng.randbytes(width * height)).convert('RGB')
+        image = Image.blend(image, grain, noise / 255)
+    return image
+
+
+def folder_paths(root, folders, depth):
+    """Paths of `folders` folders spread over `depth` levels under root"""
+    paths = []
+    last_at_level = {}
+    for k in range(folders):
+        level = k % depth
+        parent = root if level == 0 else last_at_level[level - 1]
+        path = os.path.join(parent, f'folder_{k:03d}')
+        last_at_level[level] = path
+        paths.append(path)
+    return paths
+
+
+def generate_corpus(root, folders=4, depth=2, images=10, formats=tuple(FORMATS), size=(1600, 1200),
+                    seed=0, quality=90):
+    """Build (or reuse) a synthetic tree under root and describe it.
+
+    Every folder gets `images` images of `size` pixels, cycling through
+    `formats`. HEIC is dropped when pillow_heif isn't installed. Returns
+    the corpus description also saved as corpus.json: the parameters and
+    one {path, format, bytes, width, height} record per file.
+    """
+    formats = [f for f in formats if f != 'heic' or heic_available()]
+    params = {'version': CORPUS_VERSION, 'folders': folders, 'depth': depth, 'images': images,
+              'formats': formats, 'size': list(size), 'seed': seed, 'quality': quality}
+
+    corpus_file = os.path.join(root, CORPUS_FILE)
+    try:
+        with open(corpus_file) as f:
+            corpus = json.load(f)
+        if corpus['params'] == params and all(os.path.exists(os.path.join(root, r['path']))
+                                              for r in corpus['files']):
+            return corpus
+    except (OSError, ValueError, KeyError):
+        pass
+
+    rng = random.Random(seed)
+    records = []
+    width, height = size
+    for k, folder in enumerate(folder_paths(root, folders, depth)):
+        os.makedirs(folder, exist_ok=True)
+        for i in range(images):
+            name = formats[(k + i) % len(formats)]
+            extension, pil_format = FORMATS[name]
+            path = os.path.join(folder, f'img_{i:04d}{extension}')
+            image = make_image(rng, width, height)
+            if pil_format in ('JPEG', 'HEIF'):
+                image.save(path, pil_format, quality=quality)
+            else:
+                image.save(path, pil_format)
+            records.append({'path': os.path.relpath(path, root), 'format': name,
+                            'bytes': os.path.getsize(path), 'width': width, 'height': height})
+
+    corpus = {'params': params, 'files': records}
+    with open(corpus_file, 'w') as f:
+        json.dump(corpus, f, indent=1)
+    return corpus
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height)
+
+
+def add_corpus_arguments(parser):
+    parser.add_argument('--folders', type=int, default=4, help="number of folders")
+    parser.add_argument('--depth', type=int, default=2, help="levels the folders are spread over")
+    parser.add_argument('--images', type=int, default=10, help="images per folder")
+    parser.add_argument('--formats', nargs='+', choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument('--size', type=parse_size, default=(1600, 1200), help="image size, e.g. 4032x3024")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def corpus_kwargs(args):
+    return {'folders': args.folders, 'depth': args.depth, 'images': args.images,
+            'formats': tuple(args.formats), 'size': args.size, 'seed': args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a deterministic synthetic image tree')
+    parser.add_argument('root')
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+    corpus = generate_corpus(args.root, **corpus_kwargs(args))
+    total = sum(r['bytes'] for r in corpus['files'])
+    print(f"{len(corpus['files'])} images, {total / (1024 * 1024):.1f} MB in {args.root}")
+
+
+if __name__ == '__main__':
+    main()
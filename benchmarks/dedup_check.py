@@ -0,0 +1,76 @@
+# Regression check for duplicate handling
+#
+# Builds a small folder where a near-duplicate has an exact copy of its own
+# (a.jpg, b.jpg looking like a, c.jpg byte-identical to b, d.jpg unrelated)
+# and converts it with --skip-near-duplicates on every backend and with a
+# size limit. Fails (exit 1) unless each build skips b and c, shares
+# nothing, leaves no image out and writes just the pages of a and d.
+#
+# Usage: python -m benchmarks.dedup_check
+
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from benchmarks import APP_DIR  # noqa: F401 (puts app/ on sys.path)
+import duplicates
+import shi
+
+# Option sets each build is checked with
+CASES = [
+    ({'backend': 'reportlab'}, {}),
+    ({'backend': 'direct'}, {}),
+    ({'backend': 'direct'}, {'max_pages': 1}),
+    ({}, {'max_output_mb': 1}),
+]
+
+
+def make_folder(root):
+    """Write the four images into root"""
+    from PIL import Image, ImageEnhance
+    rng = random.Random(7)
+
+    def noise(size):
+        return Image.frombytes('RGB', size, bytes(rng.randrange(256) for _ in range(size[0] * size[1] * 3)))
+
+    page = noise((32, 24)).resize((640, 480), Image.Resampling.BICUBIC)
+    page.save(os.path.join(root, 'a.jpg'), quality=90)
+    ImageEnhance.Brightness(page).enhance(1.05).save(os.path.join(root, 'b.jpg'), quality=90)
+    shutil.copy(os.path.join(root, 'b.jpg'), os.path.join(root, 'c.jpg'))
+    noise((32, 24)).resize((640, 480), Image.Resampling.BICUBIC).save(os.path.join(root, 'd.jpg'), quality=90)
+
+
+def check(root, options, settings):
+    """Problems found converting root with these options; [] if none"""
+    settings = {**shi.DEFAULT_SETTINGS, 'near_duplicates': duplicates.DEFAULT_NEAR_DISTANCE, **settings}
+    with contextlib.redirect_stdout(io.StringIO()):
+        result, = shi.create_pdf_from_images(root, preserve_originals=True, **options, **settings)
+    for pdf_file in result['pdf_files']:
+        os.remove(pdf_file)
+    expected = {'error': None, 'failed_images': [], 'pages': 2, 'near_duplicates': 2, 'duplicates': 0}
+    return [f"{key} is {result[key]!r}, expected {value!r}" for key, value in expected.items()
+            if result[key] != value]
+
+
+def main():
+    root = tempfile.mkdtemp(prefix='shi_dedup_')
+    failed = False
+    try:
+        make_folder(root)
+        for options, settings in CASES:
+            problems = check(root, options, settings)
+            print(f"{'FAIL' if problems else 'ok':<4} {options} {settings}")
+            for problem in problems:
+                print(f"     {problem}")
+            failed = failed or bool(problems)
+    finally:
+        shutil.rmtree(root)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# HEIC decode throughput: prefetch threads against the decode process pool
+#
+# Generates (or reuses) a corpus of iPhone-sized HEIC photos, then prepares
+# every one of them with shi.iter_prepared_images, first on the prefetch
+# threads alone and then through a decode_pool.DecodePool of 1, 2, 4...
+# workers up to the CPU count. pillow_heif holds the GIL for much of a
+# decode, so the threads barely scale; the processes should.
+#
+# Usage: python -m benchmarks.heic_decode [--images 24] [--size 4032x3024] [--dpi 200]
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks import corpus as corpus_module
+from benchmarks.run import peak_rss_mb
+import decode_pool
+import shi
+
+
+def time_prepare(files, settings, prefetch, decoder=None):
+    """Seconds to prepare every file, consuming the pages as a writer would"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in shi.iter_prepared_images(files, settings, prefetch, decoder=decoder):
+            pass
+    return time.perf_counter() - start
+
+
+def worker_counts(cpus):
+    counts = [1]
+    while counts[-1] * 2 <= cpus:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpus:
+        counts.append(cpus)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare HEIC decoding on threads and in the decode pool')
+    parser.add_argument('--root', help="where to build the corpus; reused across runs (default: a temp dir)")
+    parser.add_argument('--images', type=int, default=24, help="number of photos")
+    parser.add_argument('--size', type=corpus_module.parse_size, default=(4032, 3024),
+                        help="photo size (default: a 12 MP iPhone photo)")
+    parser.add_argument('--dpi', type=float, default=None, help="also downsample to this DPI")
+    parser.add_argument('--prefetch', type=int, default=shi.PREFETCH_IMAGES)
+    args = parser.parse_args()
+
+    if not corpus_module.heic_available():
+        parser.exit(1, "pillow_heif is not installed\n")
+    root = args.root or tempfile.mkdtemp(prefix='shi_corpus_')
+    try:
+        corpus = corpus_module.generate_corpus(root, folders=1, depth=1, images=args.images, formats=('heic',),
+                                               size=args.size)
+        files = [os.path.join(root, record['path']) for record in corpus['files']]
+        settings = shi.make_settings(dpi=args.dpi)
+        megabytes = sum(record['bytes'] for record in corpus['files']) / (1024 * 1024)
+        print(f"{len(files)} HEIC photos, {args.size[0]}x{args.size[1]}, {megabytes:.1f} MB"
+              + (f", downsampled to {args.dpi:g} DPI" if args.dpi else ""))
+
+        print(f"{'decoder':<18} {'seconds':>8} {'img/s':>7} {'speedup':>8}")
+        baseline = time_prepare(files, settings, args.prefetch)
+        print(f"{f'{args.prefetch} threads':<18} {baseline:>8.2f} {len(files) / baseline:>7.1f} {1:>7.2f}x")
+        for workers in worker_counts(os.cpu_count() or 1):
+            with decode_pool.DecodePool(workers) as decoder:
+                seconds = time_prepare(files, settings, max(args.prefetch, workers), decoder)
+            print(f"{f'{workers} processes':<18} {seconds:>8.2f} {len(files) / seconds:>7.1f} "
+                  f"{baseline / seconds:>7.2f}x")
+        rss = peak_rss_mb()
+        if rss is not None:
+            print(f"peak RSS {rss:.0f} MB")
+    finally:
+        if not args.root:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Cold-start check: how long `import shi` takes and what it drags in
+#
+# Runs `python -X importtime -c "import shi"` in fresh interpreters, keeps
+# the best cumulative time, and fails (exit 1) if the import is slower than
+# --max-ms or loads any of the heavy packages shi should only import on
+# first use.
+#
+# Usage: python -m benchmarks.import_time [--repeat 5] [--max-ms 100]
+
+import argparse
+import subprocess
+import sys
+
+from benchmarks import APP_DIR
+
+# Packages that must not be imported just by importing shi
+HEAVY_MODULES = ['PIL', 'reportlab', 'pillow_heif', 'tqdm', 'multiprocessing', 'concurrent.futures']
+
+
+def measure_import(module='shi'):
+    """Import module in a fresh interpreter; return (cumulative ms, imported module names)"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=APP_DIR, capture_output=True, text=True, check=True).stderr
+    seconds = None
+    modules = set()
+    for line in output.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        modules.add(name)
+        if name == module:
+            seconds = int(cumulative) / 1e6
+    return seconds * 1000, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that importing shi stays fast')
+    parser.add_argument('--repeat', type=int, default=5, help="fresh imports to run (best is kept)")
+    parser.add_argument('--max-ms', type=float, default=100.0, help="fail if the best import is slower")
+    args = parser.parse_args()
+
+    runs = [measure_import() for _ in range(args.repeat)]
+    best = min(ms for ms, _ in runs)
+    loaded = sorted(name for name in HEAVY_MODULES if name in runs[0][1])
+    print(f"import shi: best {best:.1f} ms of {args.repeat} runs (limit {args.max_ms:.0f} ms)")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: importing shi also imports {', '.join(loaded)}")
+        failed = True
+    if best > args.max_ms:
+        print(f"FAIL: import is slower than {args.max_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+# Stage-by-stage throughput benchmark for shi
+#
+# Generates (or reuses) a synthetic corpus, then times:
+#   scan   - shi.scan_tree over the tree
+#   decode - shi.prepare_image for every file
+#   layout - fit_image_to_page against a canvas that draws nothing
+#   write  - drawing the prepared pages into a PDF and saving it
+#   build  - the whole create_pdf_from_images run
+# Decode, layout and write are reported per format. Each format and the
+# build run in a fresh process, so the peak RSS reported for each is its
+# own rather than the high-water mark of everything before it. Results are
+# printed as a table and can be saved as JSON; --compare prints the change
+# against an earlier JSON file.
+#
+# Usage: python -m benchmarks.run [--size 4032x3024] [--output new.json] [--compare old.json]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks import corpus as corpus_module
+import shi
+
+RESULTS_VERSION = 2  # 2: per-format and build peak RSS measured in their own process
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its children, in MB (None if unknown)"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def in_fresh_process(func, *args):
+    """Call func(*args) in a newly spawned process and return its result, so
+    the peak_rss_mb it reports covers that call alone (a forked child would
+    start from this process's high-water mark)"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(func, *args).result()
+
+
+class NullCanvas:
+    """Accepts the canvas calls fit_image_to_page makes and draws nothing"""
+    def drawImage(self, *args, **kwargs):
+        pass
+
+    def saveState(self):
+        pass
+
+    def restoreState(self):
+        pass
+
+    def transform(self, *args):
+        pass
+
+
+def rates(count, source_bytes, seconds):
+    return {'images_per_second': count / seconds if seconds else None,
+            'mb_per_second': source_bytes / (1024 * 1024) / seconds if seconds else None}
+
+
+def bench_scan(root, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        index = shi.scan_tree(root)
+        best = min(best, time.perf_counter() - start)
+    count = sum(len(entries) for entries in index.values())
+    return {'seconds': best, 'images': count, 'folders': len(index),
+            'images_per_second': count / best if best else None, 'peak_rss_mb': peak_rss_mb()}
+
+
+def bench_format(root, files, settings, backend, work_dir):
+    """Decode, lay out and write every file of one format into one PDF"""
+    page_width, page_height = shi.PAGE_SIZE
+    null_canvas = NullCanvas()
+    pdf_file = os.path.join(work_dir, f"{files[0]['format']}.pdf")
+    c = shi._open_pdf(pdf_file, backend)
+
+    decode = layout = write = 0.0
+    pages = 0
+    for record in files:
+        start = time.perf_counter()
+        prepared = shi.prepare_image(os.path.join(root, record['path']), settings)
+        decode += time.perf_counter() - start
+        if prepared is None:
+            continue
+
+        start = time.perf_counter()
+        shi.fit_image_to_page(prepared, null_canvas, page_width, page_height)
+        layout += time.perf_counter() - start
+
+        start = time.perf_counter()
+        shi.fit_image_to_page(prepared, c, page_width, page_height)
+        c.showPage()
+        write += time.perf_counter() - start
+        pages += 1
+
+    start = time.perf_counter()
+    c.save()
+    write += time.perf_counter() - start
+
+    source_bytes = sum(r['bytes'] for r in files)
+    return {
+        'images': len(files), 'pages': pages, 'source_bytes': source_bytes,
+        'output_bytes': os.path.getsize(pdf_file),
+        'decode': {'seconds': decode, **rates(len(files), source_bytes, decode)},
+        'layout': {'seconds': layout, **rates(len(files), source_bytes, layout)},
+        'write': {'seconds': write, **rates(len(files), source_bytes, write)},
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_build(root, settings, jobs, backend):
+    """Time a full create_pdf_from_images run, then remove its PDFs"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # Keep shi's per-folder messages out of the report
+        results = shi.create_pdf_from_images(root, preserve_originals=True, jobs=jobs, backend=backend,
+                                             **settings)
+    seconds = time.perf_counter() - start
+    source_bytes = sum(r['source_bytes'] for r in results)
+    pages = sum(r['pages'] for r in results)
+    output_bytes = sum(r['pdf_bytes'] for r in results)
+    for result in results:
+        for pdf_file in result['pdf_files']:
+            os.remove(pdf_file)
+    return {'seconds': seconds, 'pages': pages, 'source_bytes': source_bytes, 'output_bytes': output_bytes,
+            **rates(pages, source_bytes, seconds), 'peak_rss_mb': peak_rss_mb()}
+
+
+def run_benchmarks(root, corpus, settings, jobs=1, backend=shi.DEFAULT_BACKEND, repeat=3):
+    """Run every stage on a generated corpus and return the results dict"""
+    results = {'version': RESULTS_VERSION, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(), 'platform': platform.platform(),
+               'corpus': corpus['params'], 'settings': settings, 'jobs': jobs, 'backend': backend,
+               'stages': {}}
+    stages = results['stages']
+    stages['scan'] = bench_scan(root, repeat)
+
+    stages['formats'] = {}
+    work_dir = tempfile.mkdtemp(prefix='shi_bench_')
+    try:
+        for name in corpus['params']['formats']:
+            files = [r for r in corpus['files'] if r['format'] == name]
+            if files:
+                stages['formats'][name] = in_fresh_process(bench_format, root, files, settings, backend, work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+
+    stages['build'] = in_fresh_process(bench_build, root, settings, jobs, backend)
+    return results
+
+
+def print_results(results):
+    scan = results['stages']['scan']
+    print(f"scan: {scan['images']} images in {scan['folders']} folders, {scan['seconds'] * 1000:.1f} ms")
+    print(f"{'format':>6} {'images':>6} {'decode img/s':>12} {'decode MB/s':>11} {'layout us':>9} "
+          f"{'write img/s':>11} {'output MB':>9}")
+    for name, stats in results['stages']['formats'].items():
+        layout_us = stats['layout']['seconds'] / stats['images'] * 1e6
+        print(f"{name:>6} {stats['images']:>6} {stats['decode']['images_per_second']:>12.1f} "
+              f"{stats['decode']['mb_per_second']:>11.1f} {layout_us:>9.1f} "
+              f"{stats['write']['images_per_second']:>11.1f} {stats['output_bytes'] / (1024 * 1024):>9.1f}")
+    build = results['stages']['build']
+    rss = build['peak_rss_mb']
+    print(f"build: {build['pages']} pages in {build['seconds']:.2f} s, {build['images_per_second']:.1f} img/s, "
+          f"{build['mb_per_second']:.1f} MB/s, {build['output_bytes'] / (1024 * 1024):.1f} MB out"
+          + (f", peak RSS {rss:.0f} MB" if rss is not None else ""))
+
+
+def backend_of(results):
+    """The PDF backend a results file was run with (older files only say 'streaming')"""
+    return results.get('backend') or ('direct' if results.get('streaming') else 'reportlab')
+
+
+def compare(old, new):
+    """Print how the headline numbers of `new` changed against `old`"""
+    def change(label, before, after, higher_is_better=True):
+        if not before or after is None:
+            return
+        ratio = after / before
+        better = ratio >= 1 if higher_is_better else ratio <= 1
+        print(f"  {label:<28} {before:>10.2f} -> {after:>10.2f}  {ratio:>5.2f}x {'' if better else '(worse)'}")
+
+    if old.get('corpus') != new.get('corpus'):
+        print("warning: the two runs used different corpora")
+    if any(old.get(key) != new.get(key) for key in ('settings', 'jobs')) or backend_of(old) != backend_of(new):
+        print("warning: the two runs used different settings")
+    print("compared with the earlier run:")
+    change('scan images/s', old['stages']['scan']['images_per_second'],
+           new['stages']['scan']['images_per_second'])
+    for name, stats in new['stages']['formats'].items():
+        before = old['stages']['formats'].get(name)
+        if before:
+            change(f'{name} decode img/s', before['decode']['images_per_second'],
+                   stats['decode']['images_per_second'])
+            change(f'{name} write img/s', before['write']['images_per_second'],
+                   stats['write']['images_per_second'])
+            change(f'{name} output bytes', before['output_bytes'], stats['output_bytes'], False)
+    change('build img/s', old['stages']['build']['images_per_second'],
+           new['stages']['build']['images_per_second'])
+    change('build peak RSS MB', old['stages']['build']['peak_rss_mb'],
+           new['stages']['build']['peak_rss_mb'], False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark shi stage by stage on a synthetic corpus')
+    corpus_module.add_corpus_arguments(parser)
+    parser.add_argument('--root', help="where to build the corpus; reused across runs (default: a temp dir)")
+    parser.add_argument('--dpi', type=float, default=None)
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="worker processes for the build stage")
+    parser.add_argument('--backend', choices=shi.PDF_BACKENDS, default=shi.DEFAULT_BACKEND,
+                        help="PDF writer to benchmark")
+    parser.add_argument('--repeat', type=int, default=3, help="scan repetitions (best is kept)")
+    parser.add_argument('--output', help="save the results as JSON")
+    parser.add_argument('--compare', help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix='shi_corpus_')
+    try:
+        corpus = corpus_module.generate_corpus(root, **corpus_module.corpus_kwargs(args))
+        settings = shi.make_settings(dpi=args.dpi)
+        results = run_benchmarks(root, corpus, settings, args.jobs, args.backend, args.repeat)
+    finally:
+        if not args.root:
+            shutil.rmtree(root)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()